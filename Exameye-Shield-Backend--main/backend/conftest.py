@@ -0,0 +1,63 @@
+"""
+Shared pytest fixtures for the backend tests
+Run with: pytest -n auto   (pytest-xdist, one model load per worker process)
+"""
+import base64
+import functools
+
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="session")
+def proctoring_service():
+    """
+    Load the MediaPipe and YOLO models once per test worker
+    get_proctoring_service() runs warmup(), so CUDA init and the
+    first-inference cost stay out of the tests
+    """
+    from proctoring_service import get_proctoring_service
+    return get_proctoring_service()
+
+
+@functools.lru_cache(maxsize=32)
+def _frame_base64(width, height, color):
+    """Encode a solid-color frame once per (width, height, color) and reuse the base64 string"""
+    # PNG with light compression: a solid-color frame encodes to a few hundred
+    # bytes and skips libjpeg's DCT entirely; the server's imdecode accepts it
+    frame = np.full((height, width, 3), color, dtype=np.uint8)
+    _, buffer = cv2.imencode('.png', frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return base64.b64encode(buffer).decode('utf-8')
+
+
+# One reusable frame buffer per shape for this worker process
+_scratch = {}
+
+
+@pytest.fixture
+def make_frame():
+    """
+    Factory for solid-color test frames
+    Refills a per-shape scratch buffer instead of allocating; a frame is only
+    valid until the next make_frame call
+    """
+    def make(width=320, height=240, color=(128, 128, 128)):
+        frame = _scratch.get((height, width))
+        if frame is None:
+            frame = _scratch[(height, width)] = np.empty((height, width, 3), dtype=np.uint8)
+        # process_frame draws overlays into the frame, so refill it on every call
+        if color[0] == color[1] == color[2]:
+            frame.fill(color[0])
+        else:
+            frame[:] = color
+        return frame
+    return make
+
+
+@pytest.fixture
+def make_frame_base64():
+    """Factory for base64 PNG test frames, encoded once per color"""
+    def make(width=320, height=240, color=(128, 128, 128)):
+        return _frame_base64(width, height, tuple(color))
+    return make
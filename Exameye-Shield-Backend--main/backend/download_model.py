@@ -12,3 +12,10 @@ destination = "models/yolov8n.pt"
 print("⬇️  Downloading YOLOv8n model...")
 urllib.request.urlretrieve(url, destination)
 print("✅ YOLOv8n model downloaded and saved to models/yolov8n.pt")
+
+# MediaPipe Tasks face landmarker, used with the GPU delegate when present
+url = "https://storage.googleapis.com/mediapipe-models/face_landmarker/face_landmarker/float16/1/face_landmarker.task"
+destination = "models/face_landmarker.task"
+print("⬇️  Downloading MediaPipe face landmarker...")
+urllib.request.urlretrieve(url, destination)
+print("✅ Face landmarker downloaded and saved to models/face_landmarker.task")
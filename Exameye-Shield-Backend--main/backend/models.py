@@ -85,6 +85,7 @@ class FrameProcessRequest(BaseModel):
     frame_base64: str
     calibrated_pitch: float
     calibrated_yaw: float
+    fast_mode: bool = False
 
 class FrameProcessResponse(BaseModel):
     timestamp: str
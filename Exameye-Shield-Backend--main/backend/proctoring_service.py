@@ -1,36 +1,359 @@
 import cv2
 import mediapipe as mp
+from mediapipe.tasks.python import BaseOptions, vision
 import numpy as np
+import torch
 from ultralytics import YOLO
 import base64
-from typing import Dict, Optional, Tuple
+import binascii
+import functools
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import time
-from datetime import datetime
+import queue
+from concurrent.futures import Future
+from dataclasses import dataclass
+from types import SimpleNamespace
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
+# libjpeg-turbo bindings, ~15% faster than cv2.imdecode for JPEG frames; cv2 is used without them
+if importlib.util.find_spec('simplejpeg') is not None:
+    import simplejpeg
+else:
+    simplejpeg = None
+
+YOLO_WEIGHTS_PATH = Path('models/yolov8n.pt')
+# An engine built ahead of time for this machine can be dropped next to the weights
+YOLO_ENGINE_PATH = YOLO_WEIGHTS_PATH.with_suffix('.engine')
+# Ultralytics dataset yaml pointing at ~200-300 representative exam frames; when present the
+# TensorRT engine is calibrated and built as INT8 instead of FP16
+YOLO_INT8_CALIB_DATA = Path('models/calib.yaml')
+# MediaPipe Tasks models for the GPU delegate (fetched by download_model.py)
+FACE_LANDMARKER_TASK_PATH = Path('models/face_landmarker.task')
+# Exported TensorRT engines are tied to the local GPU/TensorRT version, so they live in a per-machine cache
+ENGINE_CACHE_DIR = Path.home() / '.cache' / 'exameye'
+# Most frames one batched YOLO forward pass takes; a batch of 16 costs ~2 ms/frame on GPU against ~6.6 ms alone
+YOLO_MAX_BATCH = 16
+# Face mesh instances shared by the worker threads; one graph per core (up to 4) lets that many
+# sessions run MediaPipe at once, and extra instances only contend for the same core
+FACE_MESH_POOL_SIZE = min(4, os.cpu_count() or 1)
+# Violations whose message never changes are built once and shared by every frame's result.
+# Results go straight to orjson, which rejects MappingProxyType, so these stay plain dicts:
+# copy one before modifying it
+PHONE_VIOLATION = {'type': 'phone_detected', 'severity': 'high', 'message': 'Mobile phone detected'}
+BOOK_VIOLATION = {'type': 'book_detected', 'severity': 'medium', 'message': 'Book detected'}
+# Encoded frames are JPEG from the browser (PNG from the tests); anything else or anything
+# larger than MAX_FRAME_BYTES is rejected before a decoder parses it
+JPEG_MAGIC = b'\xff\xd8\xff'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+# What decode_base64/decode_image raise on malformed client data (binascii.Error is a ValueError)
+FRAME_DECODE_ERRORS = (ValueError, cv2.error)
+
+def load_yolo_model() -> YOLO:
+    """
+    Load YOLOv8n, preferring a TensorRT FP16 engine when a CUDA GPU and TensorRT are available.
+    models/yolov8n.engine is used if present; otherwise an engine taking batches of up to
+    YOLO_MAX_BATCH frames is exported once on first run and reused from ENGINE_CACHE_DIR
+    afterwards. With YOLO_INT8_CALIB_DATA in
+    place the exported engine is INT8; check phone/book recall with `yolo val` before
+    relying on it.
+    """
+    if not torch.cuda.is_available() or importlib.util.find_spec('tensorrt') is None:
+        return YOLO(str(YOLO_WEIGHTS_PATH))
+    
+    if YOLO_ENGINE_PATH.exists():
+        return YOLO(str(YOLO_ENGINE_PATH), task='detect')
+    
+    int8 = YOLO_INT8_CALIB_DATA.exists()
+    # The max batch is part of the file name, so an engine built for another batch size is not reused
+    if int8:
+        engine_path = ENGINE_CACHE_DIR / f'{YOLO_WEIGHTS_PATH.stem}-int8-b{YOLO_MAX_BATCH}.engine'
+        precision = {'int8': True, 'data': str(YOLO_INT8_CALIB_DATA)}
+    else:
+        engine_path = ENGINE_CACHE_DIR / f'{YOLO_WEIGHTS_PATH.stem}-b{YOLO_MAX_BATCH}.engine'
+        precision = {'half': True}
+    if not engine_path.exists():
+        # Ultralytics writes the engine next to the weights it exports, which for the shipped
+        # weights is YOLO_ENGINE_PATH itself. Export a copy in a private temp dir instead and
+        # os.replace the finished engine into the cache, so a crash mid-export or two workers
+        # starting together never leave a partial engine where a later start would load it
+        ENGINE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        export_dir = Path(tempfile.mkdtemp(dir=ENGINE_CACHE_DIR))
+        try:
+            logger.info(f"⚙️ Exporting YOLO to TensorRT {'INT8' if int8 else 'FP16'} engine (first run only)...")
+            export_weights = export_dir / YOLO_WEIGHTS_PATH.name
+            shutil.copyfile(YOLO_WEIGHTS_PATH, export_weights)
+            # Dynamic shapes up to YOLO_MAX_BATCH frames: a batcher flush runs as one engine call,
+            # while a lone frame still runs at batch 1 (a static batch-16 engine would zero-pad it
+            # to 16, and a static batch-1 engine splits every batch into per-frame calls);
+            # workspace is the builder's scratch memory limit in GiB
+            exported = YOLO(str(export_weights)).export(
+                format='engine', imgsz=640, device=0,
+                dynamic=True, batch=YOLO_MAX_BATCH, workspace=4, **precision
+            )
+            os.replace(exported, engine_path)
+        except Exception as e:
+            logger.warning(f"⚠️ TensorRT export failed, using PyTorch weights: {e}")
+            return YOLO(str(YOLO_WEIGHTS_PATH))
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+    
+    return YOLO(str(engine_path), task='detect')
+
+def decode_base64(data: str) -> bytes:
+    """Decode a base64 string, dropping a data-URL prefix (data:image/jpeg;base64,...) if present"""
+    # Slice past the first comma instead of split(), which would copy every part of the string
+    return base64.b64decode(data[data.find(',') + 1:])
+
+def decode_image(data: bytes, rgb: bool = False, max_edge: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    Decode JPEG or PNG bytes into a BGR frame (RGB if rgb=True), or None if unreadable, oversized or another format
+    JPEG goes straight to libjpeg-turbo through simplejpeg when it is installed. With max_edge,
+    frames only used for inference are decoded at 1/2, 1/4 or 1/8 scale in the DCT domain, as far
+    as the long edge stays at least max_edge; other formats are decoded at full size
+    """
+    if len(data) > MAX_FRAME_BYTES:
+        logger.warning("⚠️ Rejecting %d-byte frame (limit %d bytes)", len(data), MAX_FRAME_BYTES)
+        return None
+    is_jpeg = data[:3] == JPEG_MAGIC
+    if not is_jpeg and data[:8] != PNG_MAGIC:
+        return None
+    if simplejpeg is not None and is_jpeg:
+        try:
+            min_height = min_width = 0
+            if max_edge:
+                height, width, _, _ = simplejpeg.decode_jpeg_header(data)
+                factor = 1
+                while max(height, width) // (factor * 2) >= max_edge and factor < 8:
+                    factor *= 2
+                min_height, min_width = height // factor, width // factor
+            # libjpeg-turbo writes either channel order directly, so RGB costs no extra pass
+            return simplejpeg.decode_jpeg(data, colorspace='RGB' if rgb else 'BGR',
+                                          min_height=min_height, min_width=min_width)
+        except ValueError:
+            pass  # Let OpenCV have a go at streams libjpeg-turbo rejects
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if rgb and frame is not None:
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+    return frame
+
+class _TaskFaceMesh:
+    """FaceLandmarker (VIDEO mode) behind the mp.solutions FaceMesh .process() interface"""
+    
+    def __init__(self, landmarker):
+        self._landmarker = landmarker
+        self._last_timestamp_ms = 0
+    
+    def process(self, rgb_frame: np.ndarray):
+        # VIDEO mode requires strictly increasing timestamps
+        timestamp_ms = max(int(time.monotonic() * 1000), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+        result = self._landmarker.detect_for_video(image, timestamp_ms)
+        faces = [SimpleNamespace(landmark=landmarks) for landmarks in result.face_landmarks]
+        return SimpleNamespace(multi_face_landmarks=faces or None)
+
+def load_face_mesh():
+    """
+    Build the face mesh used for face counting, centering and head pose (up to 2 faces).
+    Uses the MediaPipe Tasks GPU delegate when the .task model is present, falling back
+    to the CPU (XNNPACK) mp.solutions graph otherwise.
+    """
+    if FACE_LANDMARKER_TASK_PATH.exists():
+        try:
+            landmarker = vision.FaceLandmarker.create_from_options(vision.FaceLandmarkerOptions(
+                base_options=BaseOptions(model_asset_path=str(FACE_LANDMARKER_TASK_PATH), delegate=BaseOptions.Delegate.GPU),
+                running_mode=vision.RunningMode.VIDEO,
+                num_faces=2,
+                min_face_detection_confidence=0.5,
+                min_tracking_confidence=0.5,
+                output_face_blendshapes=False
+            ))
+            logger.info("✅ MediaPipe face mesh running on the GPU delegate")
+            return _TaskFaceMesh(landmarker)
+        except Exception as e:
+            logger.warning(f"⚠️ MediaPipe GPU delegate unavailable, using CPU graph: {e}")
+    
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=2,
+        refine_landmarks=False,  # Iris/lip refinement is unused; head pose reads 6 core mesh points
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+@dataclass(slots=True)
+class HeadPoseState:
+    """Sustained looking-away tracking for one session"""
+    start_time: float
+    direction: str
+    violation_reported: bool = False  # Ensures the violation is reported only once per event
+    consecutive_frames: int = 1  # Consecutive frames looking away in this direction
+
+# Head direction codes returned by _away_decision
+LOOK_AWAY_DIRECTIONS = (None, 'right', 'left', 'down', 'up')
+
+def _away_decision(yaw: float, pitch: float, calibrated_yaw: float, calibrated_pitch: float,
+                   yaw_threshold: float, pitch_threshold: float) -> Tuple[bool, int]:
+    """
+    Per-frame looking-away decision on plain floats
+    Returns (is_away, index into LOOK_AWAY_DIRECTIONS); the direction follows whichever
+    offset from calibration crosses its threshold, preferring the larger one
+    """
+    yaw_diff = yaw - calibrated_yaw
+    pitch_diff = pitch - calibrated_pitch
+    yaw_offset = abs(yaw_diff)
+    pitch_offset = abs(pitch_diff)
+    # Either the offset from calibration or the absolute angle counts
+    # (with no calibration, 0.0, the two are the same)
+    is_away = (max(yaw_offset, abs(yaw)) >= yaw_threshold or
+               max(pitch_offset, abs(pitch)) >= pitch_threshold)
+    
+    direction = 0
+    if is_away:
+        yaw_exceeded = yaw_offset >= yaw_threshold
+        pitch_exceeded = pitch_offset >= pitch_threshold
+        if yaw_exceeded and (yaw_offset >= pitch_offset or not pitch_exceeded):
+            direction = 1 if yaw_diff > 0 else 2
+        elif pitch_exceeded:
+            direction = 3 if pitch_diff > 0 else 4
+    return is_away, direction
+
+def _rotation_vector_to_euler(rx: float, ry: float, rz: float) -> Tuple[float, float, float]:
+    """
+    Euler angles in degrees (x, y, z) of a Rodrigues rotation vector
+    Same decomposition as cv2.RQDecomp3x3(cv2.Rodrigues(rvec)[0])[0], using only the five
+    rotation matrix entries it needs; x is roll, y is pitch and z is yaw in this service's convention
+    """
+    theta = math.sqrt(rx * rx + ry * ry + rz * rz)
+    if theta < 1e-12:
+        return 0.0, 0.0, 0.0
+    kx, ky, kz = rx / theta, ry / theta, rz / theta
+    c = math.cos(theta)
+    s = math.sin(theta)
+    v = 1.0 - c
+    r00 = c + kx * kx * v
+    r10 = kx * ky * v + kz * s
+    r20 = kx * kz * v - ky * s
+    r21 = ky * kz * v + kx * s
+    r22 = c + kz * kz * v
+    return (math.degrees(math.atan2(r21, r22)),
+            math.degrees(math.asin(max(-1.0, min(1.0, -r20)))),
+            math.degrees(math.atan2(r10, r00)))
+
+@functools.lru_cache(maxsize=16)
+def _camera_matrix(width: int, height: int) -> np.ndarray:
+    """
+    Pinhole camera intrinsics for a frame size (focal length = width, centered principal point)
+    Cached per size, bounded so clients sending many resolutions cannot grow it; treat as read-only
+    """
+    focal_length = width
+    return np.array([
+        [focal_length, 0, width / 2],
+        [0, focal_length, height / 2],
+        [0, 0, 1]
+    ], dtype=np.float64)
+
+# Compile the scalar kernels to machine code when numba is installed; plain Python otherwise
+if importlib.util.find_spec('numba') is not None:
+    from numba import njit
+    _away_decision = njit(cache=True)(_away_decision)
+    _rotation_vector_to_euler = njit(cache=True, fastmath=True)(_rotation_vector_to_euler)
+
+class InferenceBatcher:
+    """
+    Coalesce detection requests from concurrent callers into one batched model call
+    Requests arriving within window_ms of the first one (up to max_batch) share a forward pass
+    """
+    
+    def __init__(self, run_batch, window_ms: float = 10, max_batch: int = 8):
+        self._run_batch = run_batch  # List[np.ndarray] -> List[result], same order
+        self._window_sec = window_ms / 1000
+        self._max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._worker, name='proctoring-yolo-batcher', daemon=True).start()
+    
+    def submit(self, frame: np.ndarray) -> Future:
+        """Queue a frame for the next batch; the future resolves to its detection result"""
+        future = Future()
+        self._queue.put((frame, future))
+        return future
+    
+    def _worker(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self._window_sec
+            while len(items) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                results = self._run_batch([frame for frame, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+
 class ProctoringService:
     """
     AI-powered proctoring service using MediaPipe and YOLOv8n
     Detects: looking away, multiple people, prohibited objects (phone, book)
+    Each instance loads its own models; use get_proctoring_service() for the shared one
     """
     
     def __init__(self):
-
         # Initialize MediaPipe
-        self.mp_face_mesh = mp.solutions.face_mesh.FaceMesh(
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        self.mp_face_detection = mp.solutions.face_detection.FaceDetection(
-            min_detection_confidence=0.5
-        )
+        self.mp_face_meshes = [load_face_mesh() for _ in range(FACE_MESH_POOL_SIZE)]
         
         # Initialize YOLO model with optimized settings
-        self.yolo_model = YOLO('models/yolov8n.pt')
+        self.yolo_model = load_yolo_model()
         self.yolo_model.conf = 0.35  # Confidence threshold (reduced for better detection)
+        # Only phones and books matter; passing their ids to YOLO lets NMS drop every other class.
+        # Detections are then matched on these integer ids (COCO: cell phone=67, book=73)
+        self._phone_class_ids = {
+            class_id for class_id, name in self.yolo_model.names.items()
+            if name in ("cell phone", "phone", "mobile")
+        }
+        self._book_class_ids = {
+            class_id for class_id, name in self.yolo_model.names.items() if name == "book"
+        }
+        self._prohibited_class_ids = sorted(self._phone_class_ids | self._book_class_ids)
+        
+        # Frames from concurrent sessions share YOLO forward passes. The batcher runs on its own
+        # thread and torch releases the GIL, so YOLO also overlaps with the MediaPipe face pipeline.
+        # It does not draw: process_frame adds the boxes once the face pipeline is done with the frame
+        self._yolo_batcher = InferenceBatcher(
+            functools.partial(self.detect_prohibited_objects_batch, draw=False), window_ms=10, max_batch=YOLO_MAX_BATCH
+        )
+        # A MediaPipe graph is not thread-safe, so each call borrows one from the pool
+        # and other threads wait only when every instance is busy
+        self._face_mesh_pool: queue.Queue = queue.Queue()
+        for face_mesh in self.mp_face_meshes:
+            self._face_mesh_pool.put(face_mesh)
+        # FaceDetection still finds faces the mesh cannot fit landmarks to, so it is
+        # asked before a frame is reported as no_person
+        self._face_detection_pool: queue.Queue = queue.Queue()
+        for _ in range(FACE_MESH_POOL_SIZE):
+            self._face_detection_pool.put(mp.solutions.face_detection.FaceDetection(min_detection_confidence=0.5))
+        
+        # Per-thread color conversion and head pose buffers, reused across frames of the same size
+        self._scratch = threading.local()
         
         # 3D Model points for head pose estimation
         self.model_points = np.array([
@@ -41,6 +364,15 @@ class ProctoringService:
             (-150.0, -150.0, -125.0),
             (150.0, -150.0, -125.0)
         ], dtype=np.float64)
+        # FaceMesh indices matching model_points: nose tip, chin, eye corners, mouth corners
+        self._pose_landmark_idx = (1, 152, 33, 263, 61, 291)
+        # Face oval contour plus nose tip: bounds the whole mesh for the centering check
+        # while reading 37 of the 468 landmarks
+        self._face_outline_idx = tuple(sorted(
+            {i for edge in mp.solutions.face_mesh.FACEMESH_FACE_OVAL for i in edge} | {1}
+        ))
+        # Lens distortion is assumed to be zero
+        self._dist_coeffs = np.zeros((4, 1))
         
         # Thresholds for head pose detection (in degrees)
         # These values detect when user looks away from screen
@@ -55,65 +387,117 @@ class ProctoringService:
         self.MIN_FACE_CONFIDENCE = 0.5  # Minimum confidence for face detection
         self.REQUIRE_STABLE_POSE = True  # Require pose to be stable before detecting
         
+        # Frames are shrunk to this long edge before MediaPipe; YOLO letterboxes to the same size
+        self.INFERENCE_MAX_EDGE = 640
+        # Mean luma below this is an all-black frame (webcam off); the face mesh is not run on it
+        self.BLACK_FRAME_BRIGHTNESS = 1.0
+        
         # Detection confidence thresholds
         self.OBJECT_CONFIDENCE_THRESHOLD = 0.35  # Reduced for better object detection
         self.FACE_CONFIDENCE_THRESHOLD = 0.4   # Reduced for better face detection
         
-        # Snapshot throttle per session: only allow snapshot every 2 seconds
+        # Snapshot throttle per session: only allow snapshot every 2 seconds (monotonic clock)
         self.SNAPSHOT_INTERVAL_SEC = 2.0
-        self.last_snapshot_time_by_session: Dict[str, float] = {}
+        # Snapshots are for reviewing violations, not archival: quality 75 baseline JPEG is
+        # ~60% smaller and ~20% faster to encode than OpenCV's default of 95
+        self.SNAPSHOT_JPEG_QUALITY = 75
+        self._snapshot_jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, self.SNAPSHOT_JPEG_QUALITY,
+                                      cv2.IMWRITE_JPEG_OPTIMIZE, 0, cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+        # Per-session dicts are LRU-bounded so ended sessions age out; they are written through
+        # _set_session_state, whose lock keeps concurrent sessions' evictions consistent
+        self.MAX_SESSIONS = 4096
+        self._session_state_lock = threading.Lock()
+        self.last_snapshot_time_by_session: Dict[str, float] = OrderedDict()
         
         # Head pose tracking for sustained looking away
-        self.head_pose_tracking: Dict[str, Dict] = {}
+        self.head_pose_tracking: Dict[str, HeadPoseState] = OrderedDict()
         self.HEAD_AWAY_DURATION_THRESHOLD_SEC = 0.5  # 0.5 seconds - faster detection while reducing false positives
         # This ensures we detect looking away quickly while filtering out momentary glances
         
+        # Skip YOLO on near-identical frames: reuse the session's last result while the dHash
+        # differs by fewer than YOLO_SKIP_HASH_DISTANCE bits, re-running at least every
+        # YOLO_MAX_REUSE_FRAMES frames so slow changes are still caught
+        self.YOLO_SKIP_HASH_DISTANCE = 4
+        self.YOLO_MAX_REUSE_FRAMES = 5
+        self._yolo_cache: Dict[str, Tuple[np.ndarray, Dict, int]] = OrderedDict()
+        
+        # Per-session state for process_frame(fast_mode=True)
+        self._last_frame_had_violations: Dict[str, bool] = OrderedDict()
+        self._last_object_check_time: Dict[str, float] = OrderedDict()
+        # Consecutive frames without a face; while the user is away fast_mode only runs YOLO
+        # on every NO_FACE_YOLO_SAMPLE_FRAMES-th frame
+        self._no_face_streak: Dict[str, int] = OrderedDict()
+        self.NO_FACE_YOLO_SAMPLE_FRAMES = 10
+        
+        # Sessions whose process_frame failure traceback has been logged (once per session)
+        self._logged_frame_error: Dict[str, bool] = OrderedDict()
+        # Sessions already warned about running without calibration
+        self._logged_no_calibration: Dict[str, bool] = OrderedDict()
+        
+        # Every per-session dict above; warmup() clears its session from all of them
+        self._session_states = (
+            self.last_snapshot_time_by_session, self.head_pose_tracking, self._yolo_cache,
+            self._last_frame_had_violations, self._last_object_check_time, self._no_face_streak,
+            self._logged_frame_error, self._logged_no_calibration,
+        )
+        
+    def warmup(self):
+        """
+        Push one tiny frame through every model so CUDA/cuDNN/TensorRT initialization
+        happens now rather than on the first real frame
+        """
+        self.process_frame(np.zeros((64, 64, 3), np.uint8), 'warmup', 0.0, 0.0)
+        # process_frame borrowed the first pooled face mesh; warm up the rest directly
+        for face_mesh in self.mp_face_meshes[1:]:
+            face_mesh.process(np.zeros((64, 64, 3), np.uint8))
+        # Kernel launches are async; wait for them so the first real frame is steady-state
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        # Forget the per-session state the warmup frame created
+        for state in self._session_states:
+            state.pop('warmup', None)
+        
+    def _set_session_state(self, state: OrderedDict, session_id: str, value):
+        """Store a session's entry in an LRU-bounded dict, evicting the least recently written sessions"""
+        # Worker threads for different sessions write concurrently; without the lock one thread's
+        # eviction could land between another's insert and move_to_end
+        with self._session_state_lock:
+            state[session_id] = value
+            state.move_to_end(session_id)
+            while len(state) > self.MAX_SESSIONS:
+                state.popitem(last=False)
+        
     def estimate_head_pose(self, landmarks, width: int, height: int) -> Optional[Tuple[float, float, float]]:
         """
         Estimate head pose (pitch, yaw, roll) from facial landmarks
         """
         try:
-            image_points = np.array([
-                (landmarks[1].x * width, landmarks[1].y * height),
-                (landmarks[152].x * width, landmarks[152].y * height),
-                (landmarks[33].x * width, landmarks[33].y * height),
-                (landmarks[263].x * width, landmarks[263].y * height),
-                (landmarks[61].x * width, landmarks[61].y * height),
-                (landmarks[291].x * width, landmarks[291].y * height)
-            ], dtype=np.float64)
+            # Write only the 6 pose landmarks, already scaled to pixels, into this thread's
+            # long-lived buffer (converting all 468 landmarks first is ~30x slower)
+            image_points = self._scratch_buffer('image_points', (6, 2), np.float64)
+            image_points.flat = [
+                c for i in self._pose_landmark_idx for lm in (landmarks[i],) for c in (lm.x * width, lm.y * height)
+            ]
             
-            focal_length = width
-            camera_matrix = np.array([
-                [focal_length, 0, width / 2],
-                [0, focal_length, height / 2],
-                [0, 0, 1]
-            ], dtype=np.float64)
+            camera_matrix = _camera_matrix(width, height)
             
+            # SQPnP: globally optimal solve without Levenberg-Marquardt refinement (~3x faster
+            # than the default iterative solver for 6 points, angles agree to about a degree)
             success, rotation_vector, _ = cv2.solvePnP(
                 self.model_points, 
                 image_points, 
                 camera_matrix, 
-                np.zeros((4, 1))
+                self._dist_coeffs,
+                flags=cv2.SOLVEPNP_SQPNP
             )
             
             if not success:
                 return None
                 
-            # Convert rotation vector to Euler angles
-            rmat, _ = cv2.Rodrigues(rotation_vector)
-            
-            # Extract Euler angles from rotation matrix (more stable method)
-            sy = np.sqrt(rmat[0,0] * rmat[0,0] + rmat[1,0] * rmat[1,0])
-            singular = sy < 1e-6
-            
-            if not singular:
-                pitch = np.arctan2(-rmat[2,0], sy) * 180 / np.pi
-                yaw = np.arctan2(rmat[1,0], rmat[0,0]) * 180 / np.pi
-                roll = np.arctan2(rmat[2,1], rmat[2,2]) * 180 / np.pi
-            else:
-                pitch = np.arctan2(-rmat[2,0], sy) * 180 / np.pi
-                yaw = np.arctan2(-rmat[1,2], rmat[1,1]) * 180 / np.pi
-                roll = 0
+            # Convert rotation vector to Euler angles on plain floats (~0.8 us compiled, ~2.9 us
+            # in Python, against ~7 us for cv2.Rodrigues plus cv2.RQDecomp3x3)
+            rx, ry, rz = rotation_vector.ravel().tolist()
+            roll, pitch, yaw = _rotation_vector_to_euler(rx, ry, rz)
             
             # Validate angles are within reasonable range (allow up to 180° for extreme turns)
             # Note: MediaPipe can sometimes give angles outside -90 to 90, which is valid for extreme head turns
@@ -141,51 +525,41 @@ class ProctoringService:
         Returns:
             True if head is turned away significantly, False otherwise
         """
-        # Always log current angles for debugging
-        logger.info(f"📐 Current angles: yaw={yaw:.1f}°, pitch={pitch:.1f}°, calibrated_yaw={calibrated_yaw:.1f}°, calibrated_pitch={calibrated_pitch:.1f}°")
+        return self._look_away(pitch, yaw, calibrated_pitch, calibrated_yaw)[0]
+    
+    def _look_away(self, pitch: float, yaw: float, calibrated_pitch: float, calibrated_yaw: float) -> Tuple[bool, Optional[str]]:
+        """
+        is_looking_away plus the direction of the turn ('left', 'right', 'up', 'down' or None)
+        """
+        is_away, direction_code = _away_decision(
+            yaw, pitch, calibrated_yaw, calibrated_pitch, self.MAX_YAW_OFFSET, self.MAX_PITCH_OFFSET
+        )
         
-        # Handle no calibration case - use absolute values with threshold
-        if calibrated_yaw == 0.0 and calibrated_pitch == 0.0:
+        # Runs on every frame: check the level once and use %-style so disabled logs cost nothing
+        if logger.isEnabledFor(logging.INFO):
+            yaw_offset = abs(yaw - calibrated_yaw)
+            pitch_offset = abs(pitch - calibrated_pitch)
             abs_yaw = abs(yaw)
             abs_pitch = abs(pitch)
-            # Check both yaw (left/right) and pitch (up/down)
-            is_away_yaw = abs_yaw >= self.MAX_YAW_OFFSET
-            is_away_pitch = abs_pitch >= self.MAX_PITCH_OFFSET
-            logger.info(f"🔍 No calibration: abs_yaw={abs_yaw:.1f}° (threshold: {self.MAX_YAW_OFFSET}°), abs_pitch={abs_pitch:.1f}° (threshold: {self.MAX_PITCH_OFFSET}°)")
-            return is_away_yaw or is_away_pitch
-        
-        # Normal case: calibration is set, use offset from calibrated position
-        yaw_offset = abs(yaw - calibrated_yaw)
-        pitch_offset = abs(pitch - calibrated_pitch)
-        
-        # Also check absolute angles as fallback (in case calibration is off)
-        abs_yaw = abs(yaw)
-        abs_pitch = abs(pitch)
-        
-        # Detect significant turns in either direction
-        # Check both offset from calibration AND absolute angle
-        is_away_yaw_offset = yaw_offset >= self.MAX_YAW_OFFSET
-        is_away_pitch_offset = pitch_offset >= self.MAX_PITCH_OFFSET
-        is_away_yaw_absolute = abs_yaw >= self.MAX_YAW_OFFSET
-        is_away_pitch_absolute = abs_pitch >= self.MAX_PITCH_OFFSET
-        
-        # Use either offset-based or absolute-based detection (whichever triggers)
-        is_away_yaw = is_away_yaw_offset or is_away_yaw_absolute
-        is_away_pitch = is_away_pitch_offset or is_away_pitch_absolute
-        
-        is_away = is_away_yaw or is_away_pitch
-        
-        # Log for debugging
-        logger.info(f"🔍 Detection: yaw_offset={yaw_offset:.1f}°, pitch_offset={pitch_offset:.1f}°, abs_yaw={abs_yaw:.1f}°, abs_pitch={abs_pitch:.1f}°")
-        if is_away:
-            if is_away_yaw:
-                logger.info(f"👀 Looking away detected (yaw): offset={yaw_offset:.1f}°, absolute={abs_yaw:.1f}° (threshold: {self.MAX_YAW_OFFSET}°)")
-            if is_away_pitch:
-                logger.info(f"👀 Looking away detected (pitch): offset={pitch_offset:.1f}°, absolute={abs_pitch:.1f}° (threshold: {self.MAX_PITCH_OFFSET}°)")
-        else:
-            logger.info(f"✅ Not looking away: yaw_offset={yaw_offset:.1f}° < {self.MAX_YAW_OFFSET}°, pitch_offset={pitch_offset:.1f}° < {self.MAX_PITCH_OFFSET}°")
+            logger.info("📐 Current angles: yaw=%.1f°, pitch=%.1f°, calibrated_yaw=%.1f°, calibrated_pitch=%.1f°",
+                        yaw, pitch, calibrated_yaw, calibrated_pitch)
+            if calibrated_yaw == 0.0 and calibrated_pitch == 0.0:
+                logger.info("🔍 No calibration: abs_yaw=%.1f° (threshold: %s°), abs_pitch=%.1f° (threshold: %s°)",
+                            abs_yaw, self.MAX_YAW_OFFSET, abs_pitch, self.MAX_PITCH_OFFSET)
+            else:
+                logger.info("🔍 Detection: yaw_offset=%.1f°, pitch_offset=%.1f°, abs_yaw=%.1f°, abs_pitch=%.1f°",
+                            yaw_offset, pitch_offset, abs_yaw, abs_pitch)
+                if not is_away:
+                    logger.info("✅ Not looking away: yaw_offset=%.1f° < %s°, pitch_offset=%.1f° < %s°",
+                                yaw_offset, self.MAX_YAW_OFFSET, pitch_offset, self.MAX_PITCH_OFFSET)
+                if max(yaw_offset, abs_yaw) >= self.MAX_YAW_OFFSET:
+                    logger.info("👀 Looking away detected (yaw): offset=%.1f°, absolute=%.1f° (threshold: %s°)",
+                                yaw_offset, abs_yaw, self.MAX_YAW_OFFSET)
+                if max(pitch_offset, abs_pitch) >= self.MAX_PITCH_OFFSET:
+                    logger.info("👀 Looking away detected (pitch): offset=%.1f°, absolute=%.1f° (threshold: %s°)",
+                                pitch_offset, abs_pitch, self.MAX_PITCH_OFFSET)
         
-        return is_away
+        return is_away, LOOK_AWAY_DIRECTIONS[direction_code]
     
     def track_head_pose(self, session_id: str, is_looking_away: bool, direction: str, current_time: float) -> Optional[Dict]:
         """
@@ -194,42 +568,38 @@ class ProctoringService:
         This ensures we detect looking away promptly while filtering out momentary glances.
         """
         if is_looking_away and direction:
-            if session_id not in self.head_pose_tracking:
+            # One lookup: another session's eviction must not land between a check and a read
+            tracking_data = self.head_pose_tracking.get(session_id)
+            if tracking_data is None:
                 # Start tracking when user starts looking away
-                self.head_pose_tracking[session_id] = {
-                    'start_time': current_time,
-                    'direction': direction,
-                    'violation_reported': False,  # Flag to ensure violation is reported only once per event
-                    'consecutive_frames': 1  # Track consecutive frames looking away
-                }
-                logger.info(f"👀 Started tracking looking away: direction={direction}")
+                self._set_session_state(self.head_pose_tracking, session_id, HeadPoseState(current_time, direction))
+                logger.info("👀 Started tracking looking away: direction=%s", direction)
                 return None
-
-            tracking_data = self.head_pose_tracking[session_id]
             
             # If direction changes, reset start time and reported flag
-            if tracking_data['direction'] != direction:
-                logger.info(f"🔄 Direction changed: {tracking_data['direction']} -> {direction}, resetting tracking")
-                tracking_data['start_time'] = current_time
-                tracking_data['direction'] = direction
-                tracking_data['violation_reported'] = False  # Reset flag on direction change
-                tracking_data['consecutive_frames'] = 1
+            if tracking_data.direction != direction:
+                logger.info("🔄 Direction changed: %s -> %s, resetting tracking", tracking_data.direction, direction)
+                tracking_data.start_time = current_time
+                tracking_data.direction = direction
+                tracking_data.violation_reported = False  # Reset flag on direction change
+                tracking_data.consecutive_frames = 1
             else:
                 # Same direction - increment consecutive frames
-                tracking_data['consecutive_frames'] = tracking_data.get('consecutive_frames', 1) + 1
+                tracking_data.consecutive_frames += 1
 
-            duration = current_time - tracking_data['start_time']
+            duration = current_time - tracking_data.start_time
 
             # Require minimum duration AND consecutive frames to reduce false positives
             # This ensures the head turn is sustained, not just a momentary glance
             min_consecutive_frames = 1  # Require at least 1 consecutive frame (reduced for faster detection)
             
             if (duration >= self.HEAD_AWAY_DURATION_THRESHOLD_SEC and 
-                tracking_data.get('consecutive_frames', 0) >= min_consecutive_frames and
-                not tracking_data.get('violation_reported')):
+                tracking_data.consecutive_frames >= min_consecutive_frames and
+                not tracking_data.violation_reported):
                 
-                tracking_data['violation_reported'] = True  # Mark as reported
-                logger.info(f"🚨 Looking away violation triggered: direction={direction}, duration={duration:.1f}s, frames={tracking_data.get('consecutive_frames', 0)}")
+                tracking_data.violation_reported = True  # Mark as reported
+                logger.info("🚨 Looking away violation triggered: direction=%s, duration=%.1fs, frames=%d",
+                            direction, duration, tracking_data.consecutive_frames)
                 return {
                     'type': 'looking_away',
                     'severity': 'high',
@@ -239,22 +609,113 @@ class ProctoringService:
                 }
         else:
             # User is not looking away, so reset tracking
-            if session_id in self.head_pose_tracking:
-                logger.info(f"✅ Head returned to normal position - resetting tracking")
-                del self.head_pose_tracking[session_id]
+            if self.head_pose_tracking.pop(session_id, None) is not None:
+                logger.info("✅ Head returned to normal position - resetting tracking")
         
         return None
 
-    def detect_multiple_faces(self, detections) -> bool:
+    def _detect_faces(self, rgb_frame: np.ndarray) -> List:
+        """
+        Run the face mesh on an RGB frame; returns the landmark lists of up to 2 faces
+        """
+        face_mesh = self._face_mesh_pool.get()
+        try:
+            return face_mesh.process(rgb_frame).multi_face_landmarks or []
+        finally:
+            self._face_mesh_pool.put(face_mesh)
+
+    def _detect_faces_fallback(self, rgb_frame: np.ndarray) -> List:
+        """
+        Run FaceDetection on an RGB frame the face mesh found no face in; returns its detections
+        """
+        face_detection = self._face_detection_pool.get()
+        try:
+            return face_detection.process(rgb_frame).detections or []
+        finally:
+            self._face_detection_pool.put(face_detection)
+
+    def _scratch_buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """
+        Reusable buffer (uint8 by default, for cv2 dst= outputs), one per thread
+        Reallocated only when the frame shape changes
+        """
+        buffer = getattr(self._scratch, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=dtype)
+            setattr(self._scratch, name, buffer)
+        return buffer
+
+    @staticmethod
+    def _mean_brightness(frame: np.ndarray) -> float:
+        """
+        Mean luma of a BGR frame, same scale as np.mean of its grayscale conversion
+        One SIMD pass over the pixels instead of a gray conversion plus a second reduction
+        """
+        b, g, r, _ = cv2.mean(frame)
+        return 0.114 * b + 0.587 * g + 0.299 * r
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Shrink a frame so its long edge is at most INFERENCE_MAX_EDGE
+        MediaPipe landmarks are normalized, so callers keep using the original width/height
+        """
+        height, width = frame.shape[:2]
+        scale = self.INFERENCE_MAX_EDGE / max(height, width)
+        if scale >= 1.0:
+            return frame
+        return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+    def detect_multiple_faces(self, faces) -> bool:
         """
         Check if multiple faces are detected
         """
-        return len(detections) > 1 if detections else False
+        return len(faces) > 1 if faces else False
 
-    def detect_prohibited_objects(self, frame: np.ndarray) -> Dict[str, any]:
+    def detect_prohibited_objects(self, frame: np.ndarray, draw: bool = True) -> Dict[str, any]:
         """
         Detect prohibited objects (cell phone, book) using YOLOv8
-        Returns dict with detection info and annotated frame
+        Returns dict with detection info and annotated frame (boxes drawn only if draw)
+        """
+        try:
+            # Run YOLO detection with confidence threshold
+            # Boxes come back in original-frame coordinates, so annotations land on the full frame
+            yolo_results = self.yolo_model(
+                frame, 
+                verbose=False,
+                conf=self.OBJECT_CONFIDENCE_THRESHOLD,
+                classes=self._prohibited_class_ids,
+                imgsz=self.INFERENCE_MAX_EDGE
+            )
+            return self._collect_prohibited_objects(frame, yolo_results, draw)
+        except Exception as e:
+            print(f"Object detection error: {e}")
+            return self._collect_prohibited_objects(frame, [], draw)
+
+    def detect_prohibited_objects_batch(self, frames: List[np.ndarray], draw: bool = True) -> List[Dict[str, any]]:
+        """
+        Detect prohibited objects in several frames with a single YOLO call
+        Ultralytics letterboxes the list into one (N, 3, H, W) batch internally
+        """
+        try:
+            yolo_results = self.yolo_model(
+                frames,
+                verbose=False,
+                conf=self.OBJECT_CONFIDENCE_THRESHOLD,
+                classes=self._prohibited_class_ids,
+                imgsz=self.INFERENCE_MAX_EDGE
+            )
+        except Exception as e:
+            logger.warning("⚠️ Batch object detection failed, retrying frame by frame: %s", e)
+            return [self.detect_prohibited_objects(frame, draw) for frame in frames]
+        
+        return [
+            self._collect_prohibited_objects(frame, [result], draw)
+            for frame, result in zip(frames, yolo_results)
+        ]
+
+    def _collect_prohibited_objects(self, frame: np.ndarray, yolo_results, draw: bool = True) -> Dict[str, any]:
+        """
+        Turn YOLO results for one frame into the detection dict, optionally drawing boxes on the frame
         """
         detections = {
             'phone_detected': False,
@@ -263,61 +724,81 @@ class ProctoringService:
         }
         
         try:
-            # Run YOLO detection with confidence threshold
-            yolo_results = self.yolo_model(
-                frame, 
-                stream=True, 
-                verbose=False,
-                conf=self.OBJECT_CONFIDENCE_THRESHOLD
-            )
-            
             for result in yolo_results:
                 if result.boxes is None or len(result.boxes) == 0:
                     continue
-                    
-                for box in result.boxes:
-                    cls = result.names[int(box.cls[0])]
-                    confidence = float(box.conf[0])
-                    
+                
+                # Copy the box tensors to host once per frame instead of once per box
+                boxes = result.boxes.cpu().numpy()
+                for class_id, confidence, xyxy in zip(boxes.cls.astype(int).tolist(), boxes.conf.tolist(), boxes.xyxy.astype(int).tolist()):
                     # Only process if confidence meets threshold
                     if confidence < self.OBJECT_CONFIDENCE_THRESHOLD:
                         continue
                     
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
+                    x1, y1, x2, y2 = xyxy
                     
                     # Detect cell phone (including variations)
-                    if cls in ["cell phone", "phone", "mobile"]:
+                    if class_id in self._phone_class_ids:
                         detections['objects'].append({
                             'type': 'cell phone',
                             'confidence': confidence,
                             'bbox': [x1, y1, x2, y2]
                         })
                         detections['phone_detected'] = True
-                        
-                        # Draw bounding box
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
-                        cv2.putText(frame, f"PHONE {confidence:.2f}", (x1, y1 - 10),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                     
                     # Detect book
-                    elif cls == "book":
+                    elif class_id in self._book_class_ids:
                         detections['objects'].append({
                             'type': 'book',
                             'confidence': confidence,
                             'bbox': [x1, y1, x2, y2]
                         })
                         detections['book_detected'] = True
-                        
-                        # Draw bounding box
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 3)
-                        cv2.putText(frame, f"BOOK {confidence:.2f}", (x1, y1 - 10),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
         except Exception as e:
             print(f"Object detection error: {e}")
         
+        if draw:
+            self._draw_prohibited_objects(frame, detections['objects'])
         detections['annotated_frame'] = frame
         return detections
 
+    @staticmethod
+    def _draw_prohibited_objects(frame: np.ndarray, objects: List[Dict]):
+        """
+        Draw bounding boxes and labels for detected objects onto the frame
+        """
+        for obj in objects:
+            x1, y1, x2, y2 = obj['bbox']
+            label, color = ("PHONE", (0, 0, 255)) if obj['type'] == 'cell phone' else ("BOOK", (255, 0, 0))
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
+            cv2.putText(frame, f"{label} {obj['confidence']:.2f}", (x1, y1 - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+    @staticmethod
+    def _frame_dhash(frame: np.ndarray) -> np.ndarray:
+        """
+        64-bit difference hash: sign of horizontal gradients on a 9x8 luminance thumbnail
+        """
+        thumb = cv2.cvtColor(cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return np.packbits(thumb[:, 1:] > thumb[:, :-1])
+
+    def _cached_object_detection(self, session_id: str, frame: np.ndarray, frame_hash: np.ndarray) -> Optional[Dict]:
+        """
+        Reuse the session's last YOLO result when the scene has not changed since YOLO last ran
+        The caller redraws the cached boxes onto the new frame so snapshots stay annotated
+        """
+        cached = self._yolo_cache.get(session_id)
+        if cached is None:
+            return None
+        cached_hash, cached_detection, reuse_count = cached
+        if reuse_count >= self.YOLO_MAX_REUSE_FRAMES:
+            return None
+        if np.count_nonzero(np.unpackbits(frame_hash ^ cached_hash)) >= self.YOLO_SKIP_HASH_DISTANCE:
+            return None
+        
+        self._set_session_state(self._yolo_cache, session_id, (cached_hash, cached_detection, reuse_count + 1))
+        return {**cached_detection, 'annotated_frame': frame}
+
     def calibrate_head_pose(self, frame: np.ndarray) -> Dict:
         """
         Calibrate head pose from a frame
@@ -325,11 +806,12 @@ class ProctoringService:
         """
         try:
             height, width, _ = frame.shape
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            small = self._downscale(frame)
+            rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._scratch_buffer('rgb', small.shape))
             
-            face_mesh_results = self.mp_face_mesh.process(rgb_frame)
-            if face_mesh_results.multi_face_landmarks:
-                landmarks = face_mesh_results.multi_face_landmarks[0].landmark
+            faces = self._detect_faces(rgb_frame)
+            if faces:
+                landmarks = faces[0].landmark
                 angles = self.estimate_head_pose(landmarks, width, height)
                 
                 if angles:
@@ -350,25 +832,28 @@ class ProctoringService:
         Check environment lighting and face detection
         """
         try:
-            height, width, _ = frame.shape
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            small = self._downscale(frame)
             
-            # Check lighting (convert to grayscale and check brightness)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = np.mean(gray)
+            # Check lighting (mean luma)
+            brightness = self._mean_brightness(small)
             lighting_ok = 40 < brightness < 220  # Acceptable range
             
-            # Check face detection
-            face_detection_results = self.mp_face_detection.process(rgb_frame)
-            face_detected = face_detection_results.detections is not None and len(face_detection_results.detections) > 0
+            # Check face detection, skipping the RGB conversion and face mesh on a black frame
+            faces = []
+            if brightness >= self.BLACK_FRAME_BRIGHTNESS:
+                rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._scratch_buffer('rgb', small.shape))
+                faces = self._detect_faces(rgb_frame)
+            face_detected = bool(faces)
             
-            # Check if face is centered
+            # Check if face is centered (center of the face outline bounding box, normalized coords)
             face_centered = False
             if face_detected:
-                detection = face_detection_results.detections[0]
-                bbox = detection.location_data.relative_bounding_box
-                center_x = bbox.xmin + bbox.width / 2
-                center_y = bbox.ymin + bbox.height / 2
+                landmarks = faces[0].landmark
+                outline = [landmarks[i] for i in self._face_outline_idx]
+                xs = [lm.x for lm in outline]
+                ys = [lm.y for lm in outline]
+                center_x = (min(xs) + max(xs)) / 2
+                center_y = (min(ys) + max(ys)) / 2
                 face_centered = (0.3 < center_x < 0.7) and (0.2 < center_y < 0.7)
             
             message = []
@@ -400,10 +885,30 @@ class ProctoringService:
                 'message': f'Environment check error: {str(e)}'
             }
 
-    def process_frame(self, frame: np.ndarray, session_id: str, calibrated_pitch: float, calibrated_yaw: float) -> Dict:
+    def process_batch(self, frames: List[np.ndarray], session_id: str, calibrated_pitch: float, calibrated_yaw: float) -> List[Dict]:
+        """
+        Process several frames of one session, running YOLO once over the whole batch
+        All frames are queued on the batcher up front, so the face pipeline of each frame
+        overlaps with the shared YOLO pass instead of waiting for it
+        """
+        if len(frames) <= 1:
+            return [self.process_frame(frame, session_id, calibrated_pitch, calibrated_yaw) for frame in frames]
+        
+        yolo_futures = [self._yolo_batcher.submit(frame) for frame in frames]
+        return [
+            self.process_frame(frame, session_id, calibrated_pitch, calibrated_yaw, yolo_future=future)
+            for frame, future in zip(frames, yolo_futures)
+        ]
+
+    def process_frame(self, frame: np.ndarray, session_id: str, calibrated_pitch: float, calibrated_yaw: float,
+                      yolo_future: Optional[Future] = None, fast_mode: bool = False) -> Dict:
         """
         Process a single frame for all violations
         Returns comprehensive violation report
+        yolo_future: detection already queued on the YOLO batcher (from process_batch)
+        fast_mode: skip YOLO while the session's last frame was clean and objects were
+        checked less than SNAPSHOT_INTERVAL_SEC ago, and while the previous frames had no
+        face except every NO_FACE_YOLO_SAMPLE_FRAMES-th frame
         """
         try:
             if frame is None:
@@ -411,21 +916,52 @@ class ProctoringService:
             
             # Log calibration values for debugging (only if not 0.0)
             if calibrated_pitch != 0.0 or calibrated_yaw != 0.0:
-                logger.info(f"🎯 Processing frame for session {session_id}: calibrated_pitch={calibrated_pitch:.1f}°, calibrated_yaw={calibrated_yaw:.1f}°")
+                logger.info("🎯 Processing frame for session %s: calibrated_pitch=%.1f°, calibrated_yaw=%.1f°",
+                            session_id, calibrated_pitch, calibrated_yaw)
             else:
                 # Only log once per session to avoid spam
-                if not hasattr(self, '_logged_no_calibration'):
-                    self._logged_no_calibration = set()
                 if session_id not in self._logged_no_calibration:
                     logger.warning(f"⚠️ No calibration set for session {session_id} - using default values. Head pose detection may be less accurate.")
-                    self._logged_no_calibration.add(session_id)
+                    self._set_session_state(self._logged_no_calibration, session_id, True)
             
             height, width, _ = frame.shape
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            
+            # One monotonic clock read per frame, shared by head pose tracking and the throttles;
+            # wall-clock time can step backwards under NTP and is only used for the result timestamp
+            now = time.monotonic()
+            
+            # YOLO runs on the batcher thread while the face pipeline runs on this thread.
+            # Boxes and text overlays are drawn after both finish, so neither model ever
+            # sees a half-drawn frame.
+            object_detection = None
+            frame_hash = None
+            no_face_streak = self._no_face_streak.get(session_id, 0)
+            if yolo_future is None:
+                # The fast_mode skips use the previous frames' state, so YOLO can still be queued
+                # before the face mesh runs on this one
+                clean_and_checked = (not self._last_frame_had_violations.get(session_id, True) and
+                                     now - self._last_object_check_time.get(session_id, 0.0) < self.SNAPSHOT_INTERVAL_SEC)
+                user_away = no_face_streak % self.NO_FACE_YOLO_SAMPLE_FRAMES != 0
+                if fast_mode and (clean_and_checked or user_away):
+                    object_detection = {'phone_detected': False, 'book_detected': False,
+                                        'objects': [], 'annotated_frame': frame}
+                else:
+                    self._set_session_state(self._last_object_check_time, session_id, now)
+                    frame_hash = self._frame_dhash(frame)
+                    object_detection = self._cached_object_detection(session_id, frame, frame_hash)
+                    if object_detection is None:
+                        yolo_future = self._yolo_batcher.submit(frame)
+            overlays = []
+            
+            # The face path works on a downscaled copy; overlays are still drawn on the full frame
+            small = self._downscale(frame)
+            # MediaPipe copies its input, so the same RGB buffer can be refilled every frame
+            rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._scratch_buffer('rgb', small.shape))
             
             # Initialize result
             result = {
-                'timestamp': datetime.utcnow().isoformat(),
+                # Unix seconds; consumers that need a date string format it themselves
+                'timestamp': time.time(),
                 'violations': [],
                 'head_pose': None,
                 'face_count': 0,
@@ -437,26 +973,27 @@ class ProctoringService:
                 'snapshot_base64': None
             }
             
-            # Detect multiple faces first
-            face_detection_results = self.mp_face_detection.process(rgb_frame)
-            if face_detection_results.detections:
-                result['face_count'] = len(face_detection_results.detections)
+            # One FaceMesh pass (max_num_faces=2) both counts faces and provides landmarks for head pose
+            faces = self._detect_faces(rgb_frame)
+            # Only frames the mesh sees no face in pay for the FaceDetection pass
+            counted_faces = faces or self._detect_faces_fallback(rgb_frame)
+            self._set_session_state(self._no_face_streak, session_id, 0 if counted_faces else no_face_streak + 1)
+            if counted_faces:
+                result['face_count'] = len(counted_faces)
                 
-                if self.detect_multiple_faces(face_detection_results.detections):
+                if self.detect_multiple_faces(counted_faces):
                     result['multiple_faces'] = True
-                    face_count = len(face_detection_results.detections)
+                    face_count = len(counted_faces)
                     result['violations'].append({
                         'type': 'multiple_person',  # Use multiple_person for consistency
                         'severity': 'high',
                         'message': f'{face_count} people detected in frame'
                     })
-                    cv2.putText(frame, "MULTIPLE PEOPLE DETECTED!", (50, 100),
-                              cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                    overlays.append(("MULTIPLE PEOPLE DETECTED!", (50, 100)))
             else:
                 # No person detected - but check if frame is too dark/black (webcam off)
                 # Calculate frame brightness to avoid false positives when webcam is black
-                gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                mean_brightness = np.mean(gray_frame)
+                mean_brightness = self._mean_brightness(small)
                 BRIGHTNESS_THRESHOLD = 15  # If frame is too dark, don't flag as violation (reduced for better detection)
                 
                 # Only flag as no_person if frame has reasonable brightness (webcam is on but no person)
@@ -467,174 +1004,166 @@ class ProctoringService:
                         'severity': 'medium',
                         'message': f'No person detected in frame (brightness: {mean_brightness:.1f})'
                     })
-                    cv2.putText(frame, "NO PERSON DETECTED!", (50, 50),
-                              cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                    overlays.append(("NO PERSON DETECTED!", (50, 50)))
                 else:
                     # Frame is too dark - likely webcam is off/black, don't flag as violation
-                    logger.info(f"⚠️  Frame too dark (brightness: {mean_brightness:.1f}), skipping no_person violation")
+                    logger.info("⚠️  Frame too dark (brightness: %.1f), skipping no_person violation", mean_brightness)
             
             # Process face mesh for head pose (only if single person detected)
             # IMPORTANT: Only process head pose if exactly 1 face is detected to reduce false positives
-            if result['face_count'] == 1:
-                logger.info(f"👤 Single face detected - processing head pose estimation")
-                face_mesh_results = self.mp_face_mesh.process(rgb_frame)
-                if face_mesh_results.multi_face_landmarks:
-                    landmarks = face_mesh_results.multi_face_landmarks[0].landmark
-                    angles = self.estimate_head_pose(landmarks, width, height)
+            if result['face_count'] == 1 and not faces:
+                logger.info("👤 Face found without landmarks - skipping head pose detection")
+            elif result['face_count'] == 1:
+                logger.info("👤 Single face detected - processing head pose estimation")
+                landmarks = faces[0].landmark
+                angles = self.estimate_head_pose(landmarks, width, height)
+                
+                if angles:
+                    logger.info("✅ Head pose estimated successfully")
+                    pitch, yaw, roll = angles
                     
-                    if angles:
-                        logger.info(f"✅ Head pose estimated successfully")
-                        pitch, yaw, roll = angles
-                        
-                        # Validate angles are reasonable (not NaN or extreme values)
-                        if not (np.isfinite(pitch) and np.isfinite(yaw) and np.isfinite(roll)):
-                            logger.warning(f"⚠️ Invalid head pose angles (NaN/Inf) - skipping detection")
-                        elif abs(yaw) > 180 or abs(pitch) > 180:
-                            logger.warning(f"⚠️ Extreme head pose angles (yaw={yaw:.1f}°, pitch={pitch:.1f}°) - may be invalid, skipping")
-                        else:
-                            result['head_pose'] = {
-                                'pitch': float(pitch),
-                                'yaw': float(yaw),
-                                'roll': float(roll)
-                            }
-                            
-                            # Warn if calibration values are 0.0 (might indicate calibration not set)
-                            if calibrated_yaw == 0.0 and calibrated_pitch == 0.0:
-                                logger.warning(f"⚠️ Calibration values are both 0.0 - using absolute yaw value for detection")
-                            
-                            # Check if looking away
-                            is_looking_away = self.is_looking_away(pitch, yaw, calibrated_pitch, calibrated_yaw)
-                            
-                            # Log head pose for debugging (only if looking away detected)
-                            if is_looking_away:
-                                yaw_offset = abs(yaw - calibrated_yaw) if calibrated_yaw != 0.0 else abs(yaw)
-                                pitch_offset = abs(pitch - calibrated_pitch) if calibrated_pitch != 0.0 else abs(pitch)
-                                logger.info(f"🔍 Head pose check: yaw={yaw:.1f}°, pitch={pitch:.1f}°, yaw_offset={yaw_offset:.1f}°, pitch_offset={pitch_offset:.1f}°, is_looking_away={is_looking_away}")
-                            
-                            # Calculate direction for tracking (if looking away)
-                            # Track all four directions: left, right, up, down
-                            direction = None
-                            if is_looking_away:
-                                # Calculate offsets from calibrated position
-                                if calibrated_yaw == 0.0:
-                                    yaw_diff = yaw
-                                else:
-                                    yaw_diff = yaw - calibrated_yaw
-                                
-                                if calibrated_pitch == 0.0:
-                                    pitch_diff = pitch
-                                else:
-                                    pitch_diff = pitch - calibrated_pitch
-                                
-                                # Determine which direction has the larger offset
-                                yaw_offset = abs(yaw_diff)
-                                pitch_offset = abs(pitch_diff)
-                                
-                                # Check which direction exceeds threshold more
-                                if yaw_offset >= self.MAX_YAW_OFFSET and yaw_offset >= pitch_offset:
-                                    # Left/right movement is dominant
-                                    direction = 'right' if yaw_diff > 0 else 'left'
-                                elif pitch_offset >= self.MAX_PITCH_OFFSET and pitch_offset >= yaw_offset:
-                                    # Up/down movement is dominant
-                                    direction = 'down' if pitch_diff > 0 else 'up'
-                                elif yaw_offset >= self.MAX_YAW_OFFSET:
-                                    # Yaw exceeds threshold (even if pitch is also high)
-                                    direction = 'right' if yaw_diff > 0 else 'left'
-                                elif pitch_offset >= self.MAX_PITCH_OFFSET:
-                                    # Pitch exceeds threshold
-                                    direction = 'down' if pitch_diff > 0 else 'up'
-                                
-                                logger.info(f"👀 Looking away detected: direction={direction}, yaw_diff={yaw_diff:.1f}°, pitch_diff={pitch_diff:.1f}°, yaw_offset={yaw_offset:.1f}°, pitch_offset={pitch_offset:.1f}°")
-                            
-                            # Track head pose for sustained violation
-                            current_time = time.time()
-                            head_pose_violation = self.track_head_pose(session_id, is_looking_away, direction, current_time)
-
-                            if head_pose_violation:
-                                logger.info(f"🚨 Looking away violation triggered: {head_pose_violation}")
-                                result['violations'].append(head_pose_violation)
-                                result['looking_away'] = True
-                                cv2.putText(frame, f"HEAD TURNED AWAY! ({head_pose_violation['duration']:.1f}s)", (50, 150), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                            elif is_looking_away:
-                                # Log that we're tracking but haven't reached duration threshold yet
-                                tracking_data = self.head_pose_tracking.get(session_id, {})
-                                if tracking_data:
-                                    duration = current_time - tracking_data.get('start_time', current_time)
-                                    frames = tracking_data.get('consecutive_frames', 0)
-                                    logger.info(f"⏳ Tracking looking away: {duration:.1f}s / {self.HEAD_AWAY_DURATION_THRESHOLD_SEC}s, frames={frames}")
+                    # Validate angles are reasonable (not NaN or extreme values)
+                    if not (np.isfinite(pitch) and np.isfinite(yaw) and np.isfinite(roll)):
+                        logger.warning(f"⚠️ Invalid head pose angles (NaN/Inf) - skipping detection")
+                    elif abs(yaw) > 180 or abs(pitch) > 180:
+                        logger.warning(f"⚠️ Extreme head pose angles (yaw={yaw:.1f}°, pitch={pitch:.1f}°) - may be invalid, skipping")
                     else:
-                        logger.warning(f"⚠️ Head pose estimation returned None - could not estimate angles")
+                        result['head_pose'] = {
+                            'pitch': float(pitch),
+                            'yaw': float(yaw),
+                            'roll': float(roll)
+                        }
+                        
+                        # Warn if calibration values are 0.0 (might indicate calibration not set)
+                        if calibrated_yaw == 0.0 and calibrated_pitch == 0.0:
+                            logger.warning("⚠️ Calibration values are both 0.0 - using absolute yaw value for detection")
+                        
+                        # Check if looking away, and in which direction (left, right, up, down)
+                        is_looking_away, direction = self._look_away(pitch, yaw, calibrated_pitch, calibrated_yaw)
+                        
+                        # Log head pose for debugging (only if looking away detected)
+                        if is_looking_away and logger.isEnabledFor(logging.INFO):
+                            yaw_diff = yaw - calibrated_yaw
+                            pitch_diff = pitch - calibrated_pitch
+                            yaw_offset = abs(yaw_diff)
+                            pitch_offset = abs(pitch_diff)
+                            logger.info("🔍 Head pose check: yaw=%.1f°, pitch=%.1f°, yaw_offset=%.1f°, pitch_offset=%.1f°, is_looking_away=%s",
+                                        yaw, pitch, yaw_offset, pitch_offset, is_looking_away)
+                            logger.info("👀 Looking away detected: direction=%s, yaw_diff=%.1f°, pitch_diff=%.1f°, yaw_offset=%.1f°, pitch_offset=%.1f°",
+                                        direction, yaw_diff, pitch_diff, yaw_offset, pitch_offset)
+                        
+                        # Track head pose for sustained violation
+                        current_time = now
+                        head_pose_violation = self.track_head_pose(session_id, is_looking_away, direction, current_time)
+
+                        if head_pose_violation:
+                            logger.info("🚨 Looking away violation triggered: %s", head_pose_violation)
+                            result['violations'].append(head_pose_violation)
+                            result['looking_away'] = True
+                            overlays.append((f"HEAD TURNED AWAY! ({head_pose_violation['duration']:.1f}s)", (50, 150)))
+                        elif is_looking_away:
+                            # Log that we're tracking but haven't reached duration threshold yet
+                            tracking_data = self.head_pose_tracking.get(session_id)
+                            if tracking_data:
+                                duration = current_time - tracking_data.start_time
+                                logger.info("⏳ Tracking looking away: %.1fs / %ss, frames=%d",
+                                            duration, self.HEAD_AWAY_DURATION_THRESHOLD_SEC, tracking_data.consecutive_frames)
                 else:
-                    logger.warning(f"⚠️ No face landmarks detected - cannot estimate head pose")
+                    logger.warning("⚠️ Head pose estimation returned None - could not estimate angles")
             elif result['face_count'] > 1:
-                logger.info(f"👥 Multiple faces detected ({result['face_count']}) - skipping head pose detection to reduce false positives")
+                logger.info("👥 Multiple faces detected (%d) - skipping head pose detection to reduce false positives", result['face_count'])
             else:
-                logger.info(f"👤 No face detected - skipping head pose detection")
+                logger.info("👤 No face detected - skipping head pose detection")
             
-            # Detect prohibited objects
-            object_detection = self.detect_prohibited_objects(frame)
+            # Collect prohibited objects; the face path is done with the frame, so boxes can be drawn now
+            if yolo_future is not None:
+                object_detection = yolo_future.result()
+                if frame_hash is not None:
+                    cached_detection = {k: v for k, v in object_detection.items() if k != 'annotated_frame'}
+                    self._set_session_state(self._yolo_cache, session_id, (frame_hash, cached_detection, 0))
+            self._draw_prohibited_objects(frame, object_detection['objects'])
+            for text, org in overlays:
+                cv2.putText(frame, text, org, cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
             result['phone_detected'] = object_detection['phone_detected']
             result['book_detected'] = object_detection['book_detected']
             
             if object_detection['phone_detected']:
-                result['violations'].append({
-                    'type': 'phone_detected',
-                    'severity': 'high',
-                    'message': 'Mobile phone detected'
-                })
+                result['violations'].append(PHONE_VIOLATION)
             
             if object_detection['book_detected']:
-                result['violations'].append({
-                    'type': 'book_detected',
-                    'severity': 'medium',
-                    'message': 'Book detected'
-                })
+                result['violations'].append(BOOK_VIOLATION)
             
             # If violations exist, capture snapshot (throttled per session)
             if result['violations']:
-                now_ts = time.time()
-                last_ts = self.last_snapshot_time_by_session.get(session_id, 0.0)
-                if (now_ts - last_ts) >= self.SNAPSHOT_INTERVAL_SEC:
+                last_ts = self.last_snapshot_time_by_session.get(session_id, float('-inf'))
+                if (now - last_ts) >= self.SNAPSHOT_INTERVAL_SEC:
                     annotated_frame = object_detection['annotated_frame']
-                    _, buffer = cv2.imencode('.jpg', annotated_frame)
-                    result['snapshot_base64'] = base64.b64encode(buffer).decode('utf-8')
-                    self.last_snapshot_time_by_session[session_id] = now_ts
+                    _, buffer = cv2.imencode('.jpg', annotated_frame, self._snapshot_jpeg_params)
+                    # b2a_base64 directly skips b64encode's Python wrapper; the output is pure ASCII
+                    result['snapshot_base64'] = binascii.b2a_base64(buffer, newline=False).decode('ascii')
+                    self._set_session_state(self.last_snapshot_time_by_session, session_id, now)
             
+            self._set_session_state(self._last_frame_had_violations, session_id, bool(result['violations']))
             return result
             
         except Exception as e:
+            # Bad input is rejected before this point (decode_image returns None), so this is a bug:
+            # keep the session alive, but log the traceback once per session rather than hiding it
+            if session_id not in self._logged_frame_error:
+                self._set_session_state(self._logged_frame_error, session_id, True)
+                logger.exception("❌ Frame processing failed for session %s", session_id)
             return {'error': f'Frame processing error: {str(e)}'}
 
     def calibrate_from_frame(self, frame_base64: str) -> Optional[Tuple[float, float]]:
         """
         Extract calibration values (pitch, yaw) from a frame
+        Returns None for an empty, undecodable or faceless frame
         """
+        if not frame_base64:
+            return None
+        
+        # Only decoding can fail on bad client data; anything later is a bug and is not swallowed
         try:
-            # Decode base64 frame
-            frame_data = base64.b64decode(frame_base64.split(',')[1] if ',' in frame_base64 else frame_base64)
-            nparr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame is None:
-                return None
-            
-            height, width, _ = frame.shape
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            face_mesh_results = self.mp_face_mesh.process(rgb_frame)
-            if face_mesh_results.multi_face_landmarks:
-                landmarks = face_mesh_results.multi_face_landmarks[0].landmark
-                angles = self.estimate_head_pose(landmarks, width, height)
-                
-                if angles:
-                    pitch, yaw, _ = angles
-                    return (float(pitch), float(yaw))
-            
+            # Decode base64 frame straight to RGB for MediaPipe, at reduced scale if it is large;
+            # nothing here needs BGR, and the pose angles do not depend on the frame size
+            frame_data = decode_base64(frame_base64)
+            rgb_frame = decode_image(frame_data, rgb=True, max_edge=self.INFERENCE_MAX_EDGE)
+        except FRAME_DECODE_ERRORS as e:
+            logger.warning("⚠️ Calibration frame could not be decoded: %s", e)
             return None
-        except Exception as e:
-            print(f"Calibration error: {e}")
+        
+        if rgb_frame is None:
             return None
+        
+        height, width, _ = rgb_frame.shape
+        
+        faces = self._detect_faces(rgb_frame)
+        if faces:
+            landmarks = faces[0].landmark
+            angles = self.estimate_head_pose(landmarks, width, height)
+            
+            if angles:
+                pitch, yaw, _ = angles
+                return (float(pitch), float(yaw))
+        
+        return None
+
+# Shared instance: YOLO weights and MediaPipe graphs are loaded once per process
+_service: Optional[ProctoringService] = None
+_service_lock = threading.Lock()
 
-# Global instance
-proctoring_service = ProctoringService()
+def get_proctoring_service() -> ProctoringService:
+    """
+    Shared, warmed-up service instance
+    Models load on the first call rather than at import, so importing this module stays cheap.
+    Concurrent first calls wait on the lock for the one instance being built
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                service = ProctoringService()
+                service.warmup()
+                # Published only once fully loaded and warmed up
+                _service = service
+    return _service
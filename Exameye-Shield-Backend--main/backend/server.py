@@ -8,25 +8,26 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
 from typing import Dict, List
-import base64
-import cv2
 import numpy as np
 from datetime import datetime
 import asyncio
 import logging
 import json
+import orjson
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 import uuid
 import re
+import struct
+from multiprocessing import resource_tracker, shared_memory
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-from proctoring_service import ProctoringService
+from proctoring_service import FRAME_DECODE_ERRORS, decode_base64, decode_image, get_proctoring_service
 from grading_service import grading_service
 from models import (
     FrameProcessRequest,
@@ -52,7 +53,8 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting AI Proctoring Service...")
     try:
-        # Any startup tasks can go here
+        # Load and warm up the models once per worker process, before it accepts connections
+        await asyncio.to_thread(get_proctoring_service)
         logger.info("✅ AI Proctoring Service started successfully")
         yield
     except asyncio.CancelledError:
@@ -97,9 +99,6 @@ supabase_url = os.environ.get("SUPABASE_URL", "https://ukwnvvuqmiqrjlghgxnf.supa
 supabase_key = os.environ.get("SUPABASE_KEY", "")
 supabase: Client = create_client(supabase_url, supabase_key)
 
-# Initialize Proctoring Service
-proctoring_service = ProctoringService()
-
 # Helper function to validate and convert UUID
 def validate_uuid(value):
     """Validate if a value is a valid UUID, return it or None"""
@@ -114,6 +113,97 @@ def validate_uuid(value):
         logger.warning(f"Invalid UUID format: {value}, using None instead")
         return None
 
+def _decode_frame(frame_base64: str):
+    """Decode a base64 (optionally data-URL prefixed) image into a BGR frame, or None"""
+    if not isinstance(frame_base64, str):
+        logger.error(f"❌ Frame decode error: expected a base64 string, got {type(frame_base64).__name__}")
+        return None
+    try:
+        frame_data = decode_base64(frame_base64)
+        logger.info(f"📦 Frame data decoded: {len(frame_data)} bytes")
+        return decode_image(frame_data)
+    except FRAME_DECODE_ERRORS as decode_err:
+        logger.error(f"❌ Frame decode error: {decode_err}")
+        return None
+
+# Binary frame messages: little-endian (height, width, channels) header, then raw uint8 BGR pixels
+RAW_FRAME_HEADER = struct.Struct('<III')
+
+def _decode_raw_frame(payload: bytes):
+    """Decode a binary frame message into a BGR frame, or None if the payload is malformed"""
+    if not isinstance(payload, bytes) or len(payload) < RAW_FRAME_HEADER.size:
+        return None
+    height, width, channels = RAW_FRAME_HEADER.unpack_from(payload)
+    if channels != 3 or len(payload) - RAW_FRAME_HEADER.size != height * width * channels:
+        logger.error(f"❌ Raw frame size mismatch: header={height}x{width}x{channels}, payload={len(payload)} bytes")
+        return None
+    # Copy out of the immutable message bytes: process_frame draws its overlays in place
+    return np.frombuffer(payload, np.uint8, offset=RAW_FRAME_HEADER.size).reshape(height, width, channels).copy()
+
+# Same-machine clients may hand frames over through POSIX shared memory instead of
+# JPEG+base64. Opt-in only: a remote client must not be able to read local segments.
+SHM_FRAMES_ENABLED = bool(os.environ.get('EXAMEYE_SHM'))
+
+def _read_shm_frame(name: str, shape):
+    """Copy a BGR frame out of a client-owned shared memory block, or None"""
+    try:
+        height, width, channels = (int(d) for d in shape)
+        shm = shared_memory.SharedMemory(name=name)
+    except (TypeError, ValueError, OSError) as shm_err:
+        logger.error(f"❌ Shared memory frame error: {shm_err}")
+        return None
+    try:
+        # The client owns the block; keep this process's resource tracker from unlinking it
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        if channels != 3 or shm.size < height * width * channels:
+            logger.error(f"❌ Shared memory frame size mismatch: shape={height}x{width}x{channels}, size={shm.size}")
+            return None
+        view = np.ndarray((height, width, channels), np.uint8, buffer=shm.buf)
+        frame = view.copy()
+        del view
+        return frame
+    finally:
+        shm.close()
+
+def _decode_message_frame(message: dict):
+    """Decode the frame carried by a 'frame', 'raw_frame' or 'frame_shm' message, or None"""
+    if message['type'] == 'raw_frame':
+        return _decode_raw_frame(message.get('frame'))
+    if message['type'] == 'frame_shm':
+        return _read_shm_frame(message.get('name'), message.get('shape', ())) if SHM_FRAMES_ENABLED else None
+    return _decode_frame(message.get('frame'))
+
+# Decode and detection run together on a worker thread, so one session's JPEG decode overlaps
+# with other sessions' face mesh and YOLO work instead of stalling the event loop
+def _decode_and_process_frame(message: dict, session_id: str):
+    """Decode one frame message and run detection on it; None if the frame could not be decoded"""
+    frame = _decode_message_frame(message)
+    logger.info(f"🖼️  Frame decode result: {frame is not None}")
+    if frame is None:
+        return None
+    
+    calibrated_pitch = float(message.get('calibrated_pitch', 0.0))
+    calibrated_yaw = float(message.get('calibrated_yaw', 0.0))
+    logger.info(f"🔍 Frame decoded successfully: {frame.shape}, Calibration: pitch={calibrated_pitch:.2f}°, yaw={calibrated_yaw:.2f}°")
+    # Clients may opt into fast_mode: YOLO is skipped on clean frames between object checks
+    return get_proctoring_service().process_frame(frame, session_id, calibrated_pitch, calibrated_yaw,
+                                            fast_mode=bool(message.get('fast_mode')))
+
+def _decode_and_process_batch(message: dict, session_id: str):
+    """Decode a frame_batch message and run detection over it; None if no frame could be decoded"""
+    encoded = message.get('frames')
+    if not isinstance(encoded, list):
+        return None
+    frames = [_decode_frame(f) for f in encoded]
+    frames = [f for f in frames if f is not None]
+    logger.info(f"🎞️  Frame batch decoded: {len(frames)}/{len(encoded)} frames")
+    if not frames:
+        return None
+    
+    calibrated_pitch = float(message.get('calibrated_pitch', 0.0))
+    calibrated_yaw = float(message.get('calibrated_yaw', 0.0))
+    return get_proctoring_service().process_batch(frames, session_id, calibrated_pitch, calibrated_yaw)
+
 # Active WebSocket connections
 active_connections: Dict[str, WebSocket] = {}
 
@@ -132,7 +222,7 @@ def _upload_snapshot_and_get_url(
     try:
         if not snapshot_base64:
             return None
-        image_data = base64.b64decode(snapshot_base64.split(',')[1] if ',' in snapshot_base64 else snapshot_base64)
+        image_data = decode_base64(snapshot_base64)
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         # Use roll_no for file organization: exam_id/roll_no_violation_type_timestamp.jpg
         filename = f"{exam_id}/{roll_no}_{violation_type}_{timestamp}.jpg"
@@ -159,8 +249,8 @@ async def root():
         "status": "running",
         "version": "1.0.0",
         "models": {
-            "yolo": proctoring_service.yolo_model is not None,
-            "mediapipe": proctoring_service.mp_face_mesh is not None
+            "yolo": get_proctoring_service().yolo_model is not None,
+            "mediapipe": bool(get_proctoring_service().mp_face_meshes)
         }
     }
 
@@ -169,7 +259,7 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "models_loaded": proctoring_service.yolo_model is not None
+        "models_loaded": get_proctoring_service().yolo_model is not None
     }
 
 
@@ -230,16 +320,15 @@ async def grade_exam(request: dict):
 async def calibrate(request: CalibrationRequest):
     """Calibrate head pose for a student"""
     try:
-        # Decode base64 frame
-        frame_data = base64.b64decode(request.frame_base64.split(',')[1] if ',' in request.frame_base64 else request.frame_base64)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode base64 frame; only the models see it, so a large JPEG is decoded at reduced scale
+        frame_data = decode_base64(request.frame_base64)
+        frame = decode_image(frame_data, max_edge=get_proctoring_service().INFERENCE_MAX_EDGE)
         
         if frame is None:
             return CalibrationResponse(success=False, message="Invalid frame data")
         
         # Get calibration values
-        result = proctoring_service.calibrate_head_pose(frame)
+        result = get_proctoring_service().calibrate_head_pose(frame)
         
         if result['success']:
             return CalibrationResponse(
@@ -261,10 +350,9 @@ async def calibrate(request: CalibrationRequest):
 async def check_environment(request: EnvironmentCheckRequest):
     """Check lighting and face detection for environment verification"""
     try:
-        # Decode base64 frame
-        frame_data = base64.b64decode(request.frame_base64.split(',')[1] if ',' in request.frame_base64 else request.frame_base64)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode base64 frame; only the models see it, so a large JPEG is decoded at reduced scale
+        frame_data = decode_base64(request.frame_base64)
+        frame = decode_image(frame_data, max_edge=get_proctoring_service().INFERENCE_MAX_EDGE)
         
         if frame is None:
             return EnvironmentCheck(
@@ -276,11 +364,11 @@ async def check_environment(request: EnvironmentCheckRequest):
             )
         
         # Check environment
-        result = proctoring_service.check_environment(frame)
+        result = get_proctoring_service().check_environment(frame)
         
         # Also check for multiple faces using process_frame
         try:
-            detection_result = proctoring_service.process_frame(
+            detection_result = get_proctoring_service().process_frame(
                 frame=frame,
                 calibrated_pitch=0.0,
                 calibrated_yaw=0.0,
@@ -314,19 +402,19 @@ async def process_frame(request: FrameProcessRequest):
     """Process a single frame for violations"""
     try:
         # Decode base64 frame
-        frame_data = base64.b64decode(request.frame_base64.split(',')[1] if ',' in request.frame_base64 else request.frame_base64)
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        frame_data = decode_base64(request.frame_base64)
+        frame = decode_image(frame_data)
         
         if frame is None:
             raise HTTPException(status_code=400, detail="Invalid frame data")
         
         # Process frame
-        result = proctoring_service.process_frame(
+        result = get_proctoring_service().process_frame(
             frame,
             request.session_id,
             request.calibrated_pitch,
-            request.calibrated_yaw
+            request.calibrated_yaw,
+            fast_mode=request.fast_mode
         )
         
         # Convert violations to response format
@@ -362,6 +450,136 @@ violation_cooldowns: Dict[str, Dict[str, float]] = {}
 VIOLATION_COOLDOWN_SEC = 10.0  # Don't log same violation type within 10 seconds
 LOOKING_AWAY_COOLDOWN_SEC = 3.0  # Separate cooldown for looking_away (reduced since detection is now immediate)
 
+async def _handle_detection_result(websocket: WebSocket, session_id: str, message: dict, result: dict):
+    """Log, persist and send back the detection result for one processed frame"""
+    violations_count = len(result.get('violations', []))
+    logger.info(f"🎯 Detection result: {violations_count} violations found")
+    logger.info(f"📊 Detection details: faces={result.get('face_count', 0)}, no_person={result.get('no_person', False)}, multiple={result.get('multiple_faces', False)}, looking_away={result.get('looking_away', False)}, phone={result.get('phone_detected', False)}, book={result.get('book_detected', False)}")
+
+    # Log head pose info if available
+    if result.get('head_pose'):
+        hp = result['head_pose']
+        logger.info(f"📐 Head pose: pitch={hp.get('pitch', 0):.1f}°, yaw={hp.get('yaw', 0):.1f}°, roll={hp.get('roll', 0):.1f}°")
+
+    # Log each violation type found
+    if violations_count > 0:
+        for v in result.get('violations', []):
+            logger.info(f"🚨 Violation detected: type={v.get('type')}, severity={v.get('severity')}, message={v.get('message', '')[:50]}")
+    else:
+        logger.info(f"✅ No violations detected in this frame")
+    # Persist violations with snapshot evidence
+    try:
+        exam_id = message.get('exam_id')
+        student_id = message.get('student_id')
+        roll_no = message.get('roll_no') or message.get('rollNo') or "UNKNOWN"
+        student_name = message.get('student_name')
+        subject_code = message.get('subject_code', '')
+        subject_name = message.get('subject_name', '')
+        logger.info(f"📋 Extracted from message: exam_id={exam_id}, student_id={student_id}, roll_no={roll_no}, student_name='{student_name}', subject='{subject_name}' ({subject_code})")
+        snapshot_b64 = result.get('snapshot_base64')
+        # Track which violations were actually saved (not skipped due to cooldown)
+        saved_violations = []
+        # If there are violations, upload snapshot and insert rows
+        if result.get('violations'):
+            logger.info(f"💾 Saving {len(result['violations'])} violations to database with student_name='{student_name}', roll_no='{roll_no}'...")
+            image_url = None
+            # Upload once and reuse URL for all violations in this frame
+            if snapshot_b64:
+                logger.info(f"📸 Uploading snapshot for violation...")
+                image_url = _upload_snapshot_and_get_url(
+                    supabase, exam_id or "unknown_exam", roll_no or "UNKNOWN",
+                    result['violations'][0]['type'], snapshot_b64
+                )
+                logger.info(f"✅ Snapshot uploaded: {image_url}")
+            else:
+                logger.warning("⚠️ No snapshot available for violation")
+            # Insert one record per violation type (with cooldown check)
+            now_ts = asyncio.get_event_loop().time()
+            for v in result['violations']:
+                violation_type = v.get("type")
+
+                # Use different cooldown for looking_away (needs longer cooldown since it requires 6s duration)
+                cooldown_sec = LOOKING_AWAY_COOLDOWN_SEC if violation_type == 'looking_away' else VIOLATION_COOLDOWN_SEC
+
+                # Check cooldown: skip if same violation type was logged recently
+                last_violation_time = violation_cooldowns[session_id].get(violation_type, 0)
+                if (now_ts - last_violation_time) < cooldown_sec:
+                    logger.info(f"⏸️  Violation {violation_type} skipped (cooldown: {cooldown_sec}s, elapsed: {now_ts - last_violation_time:.1f}s)")
+                    continue
+
+                # Update cooldown timestamp
+                violation_cooldowns[session_id][violation_type] = now_ts
+                logger.info(f"✅ Violation {violation_type} passed cooldown check - will save to database")
+
+                # Ensure exam_id and student_id are valid UUIDs or None (not empty strings)
+                exam_id_str = str(exam_id).strip() if exam_id else ''
+                student_id_str = str(student_id).strip() if student_id else ''
+
+                valid_exam_id = validate_uuid(exam_id_str) if exam_id_str else None
+                valid_student_id = validate_uuid(student_id_str) if student_id_str else None
+
+                violation_record = {
+                    "id": str(uuid.uuid4()),
+                    "exam_id": valid_exam_id,
+                    "student_id": valid_student_id,
+                    "violation_type": violation_type,
+                    "severity": v.get("severity"),
+                    "details": {
+                        "message": v.get("message"),
+                        "confidence": v.get("confidence"),
+                        "session_id": session_id,
+                        "student_name": student_name,
+                        "roll_no": roll_no or "UNKNOWN",
+                        "student_id": student_id,
+                        "subject_code": subject_code,
+                        "subject_name": subject_name,
+                    },
+                    "image_url": image_url,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+                try:
+                    supabase.table('violations').insert(violation_record).execute()
+                    logger.info(f"✅ Violation saved: {violation_type} - {v.get('message')}")
+                    # Only add to saved_violations if successfully saved
+                    saved_violations.append(v)
+                except Exception as db_err:
+                    logger.error(f"❌ Insert violation failed: {db_err}")
+        else:
+            logger.info("✅ No violations detected in this frame")
+    except Exception as persist_err:
+        logger.error(f"❌ Persisting violation failed: {persist_err}")
+
+    # Send results back to client - ONLY include violations that were actually saved
+    # This prevents duplicate counting in the frontend
+    if message.get('compact'):
+        # Clients that only act on violations (e.g. the test harness) skip the
+        # snapshot and debug fields entirely
+        result_to_send = {'violations': saved_violations}
+    else:
+        result_to_send = result.copy()
+        result_to_send['violations'] = saved_violations
+    # orjson handles the long snapshot_base64 string much faster than stdlib json
+    await websocket.send_text(orjson.dumps({
+        'type': 'detection_result',
+        'data': result_to_send
+    }, option=orjson.OPT_SERIALIZE_NUMPY).decode())
+    logger.info(f"📤 Detection result sent to client")
+
+    # Also send individual violation alerts to frontend (only for saved violations)
+    if saved_violations:
+        for v in saved_violations:
+            await websocket.send_json({
+                'type': 'violation',
+                'data': {
+                    'type': v.get('type'),
+                    'severity': v.get('severity'),
+                    'message': v.get('message'),
+                    'confidence': v.get('confidence'),
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            })
+            logger.info(f"🚨 Violation alert sent to frontend: {v.get('type')}")
+
 @app.websocket("/api/ws/proctoring/{session_id}")
 async def websocket_proctoring(websocket: WebSocket, session_id: str):
     """WebSocket endpoint for real-time proctoring"""
@@ -380,13 +598,21 @@ async def websocket_proctoring(websocket: WebSocket, session_id: str):
         # Throttle: only process a frame every 2 seconds per connection
         last_processed_time = 0.0
         FRAME_INTERVAL_SEC = 2.0
+        # Calibration and exam/student fields for binary frames, set by 'frame_meta' messages
+        frame_meta = {}
         while True:
             # Receive frame data from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            packet = await websocket.receive()
+            if packet['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(packet.get('code', 1000))
+            if packet.get('bytes') is not None:
+                # Binary message: raw frame pixels, no JPEG/base64 round trip
+                message = {**frame_meta, 'type': 'raw_frame', 'frame': packet['bytes']}
+            else:
+                message = orjson.loads(packet['text'])
             logger.info(f"📥 Received message type: {message.get('type')}")
             
-            if message['type'] == 'frame':
+            if message['type'] in ('frame', 'raw_frame', 'frame_shm'):
                 student_name = message.get('student_name', 'Unknown')
                 student_id = message.get('student_id', 'Unknown')
                 logger.info(f"🎥 Processing frame from student: name='{student_name}', id='{student_id}'")
@@ -394,149 +620,12 @@ async def websocket_proctoring(websocket: WebSocket, session_id: str):
                 now_ts = asyncio.get_event_loop().time()
                 if (now_ts - last_processed_time) >= FRAME_INTERVAL_SEC:
                     last_processed_time = now_ts
-                    # Process frame
-                    try:
-                        frame_data = base64.b64decode(message['frame'].split(',')[1] if ',' in message['frame'] else message['frame'])
-                        logger.info(f"📦 Frame data decoded: {len(frame_data)} bytes")
-                        nparr = np.frombuffer(frame_data, np.uint8)
-                        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                        logger.info(f"🖼️  Frame decode result: {frame is not None}")
-                    except Exception as decode_err:
-                        logger.error(f"❌ Frame decode error: {decode_err}")
-                        frame = None
+                    # Decode and process off the event loop, so frames from other sessions
+                    # can share YOLO batches
+                    result = await asyncio.to_thread(_decode_and_process_frame, message, session_id)
                     
-                    if frame is not None:
-                        calibrated_pitch = float(message.get('calibrated_pitch', 0.0))
-                        calibrated_yaw = float(message.get('calibrated_yaw', 0.0))
-                        logger.info(f"🔍 Frame decoded successfully: {frame.shape}, Calibration: pitch={calibrated_pitch:.2f}°, yaw={calibrated_yaw:.2f}°")
-                        
-                        result = proctoring_service.process_frame(
-                            frame,
-                            session_id,
-                            calibrated_pitch,
-                            calibrated_yaw
-                        )
-                        violations_count = len(result.get('violations', []))
-                        logger.info(f"🎯 Detection result: {violations_count} violations found")
-                        logger.info(f"📊 Detection details: faces={result.get('face_count', 0)}, no_person={result.get('no_person', False)}, multiple={result.get('multiple_faces', False)}, looking_away={result.get('looking_away', False)}, phone={result.get('phone_detected', False)}, book={result.get('book_detected', False)}")
-                        
-                        # Log head pose info if available
-                        if result.get('head_pose'):
-                            hp = result['head_pose']
-                            logger.info(f"📐 Head pose: pitch={hp.get('pitch', 0):.1f}°, yaw={hp.get('yaw', 0):.1f}°, roll={hp.get('roll', 0):.1f}°")
-                        
-                        # Log each violation type found
-                        if violations_count > 0:
-                            for v in result.get('violations', []):
-                                logger.info(f"🚨 Violation detected: type={v.get('type')}, severity={v.get('severity')}, message={v.get('message', '')[:50]}")
-                        else:
-                            logger.info(f"✅ No violations detected in this frame")
-                        # Persist violations with snapshot evidence
-                        try:
-                            exam_id = message.get('exam_id')
-                            student_id = message.get('student_id')
-                            roll_no = message.get('roll_no') or message.get('rollNo') or "UNKNOWN"
-                            student_name = message.get('student_name')
-                            subject_code = message.get('subject_code', '')
-                            subject_name = message.get('subject_name', '')
-                            logger.info(f"📋 Extracted from message: exam_id={exam_id}, student_id={student_id}, roll_no={roll_no}, student_name='{student_name}', subject='{subject_name}' ({subject_code})")
-                            snapshot_b64 = result.get('snapshot_base64')
-                            # Track which violations were actually saved (not skipped due to cooldown)
-                            saved_violations = []
-                            # If there are violations, upload snapshot and insert rows
-                            if result.get('violations'):
-                                logger.info(f"💾 Saving {len(result['violations'])} violations to database with student_name='{student_name}', roll_no='{roll_no}'...")
-                                image_url = None
-                                # Upload once and reuse URL for all violations in this frame
-                                if snapshot_b64:
-                                    logger.info(f"📸 Uploading snapshot for violation...")
-                                    image_url = _upload_snapshot_and_get_url(
-                                        supabase, exam_id or "unknown_exam", roll_no or "UNKNOWN",
-                                        result['violations'][0]['type'], snapshot_b64
-                                    )
-                                    logger.info(f"✅ Snapshot uploaded: {image_url}")
-                                else:
-                                    logger.warning("⚠️ No snapshot available for violation")
-                                # Insert one record per violation type (with cooldown check)
-                                now_ts = asyncio.get_event_loop().time()
-                                for v in result['violations']:
-                                    violation_type = v.get("type")
-                                    
-                                    # Use different cooldown for looking_away (needs longer cooldown since it requires 6s duration)
-                                    cooldown_sec = LOOKING_AWAY_COOLDOWN_SEC if violation_type == 'looking_away' else VIOLATION_COOLDOWN_SEC
-                                    
-                                    # Check cooldown: skip if same violation type was logged recently
-                                    last_violation_time = violation_cooldowns[session_id].get(violation_type, 0)
-                                    if (now_ts - last_violation_time) < cooldown_sec:
-                                        logger.info(f"⏸️  Violation {violation_type} skipped (cooldown: {cooldown_sec}s, elapsed: {now_ts - last_violation_time:.1f}s)")
-                                        continue
-                                    
-                                    # Update cooldown timestamp
-                                    violation_cooldowns[session_id][violation_type] = now_ts
-                                    logger.info(f"✅ Violation {violation_type} passed cooldown check - will save to database")
-                                    
-                                    # Ensure exam_id and student_id are valid UUIDs or None (not empty strings)
-                                    exam_id_str = str(exam_id).strip() if exam_id else ''
-                                    student_id_str = str(student_id).strip() if student_id else ''
-                                    
-                                    valid_exam_id = validate_uuid(exam_id_str) if exam_id_str else None
-                                    valid_student_id = validate_uuid(student_id_str) if student_id_str else None
-                                    
-                                    violation_record = {
-                                        "id": str(uuid.uuid4()),
-                                        "exam_id": valid_exam_id,
-                                        "student_id": valid_student_id,
-                                        "violation_type": violation_type,
-                                        "severity": v.get("severity"),
-                                        "details": {
-                                            "message": v.get("message"),
-                                            "confidence": v.get("confidence"),
-                                            "session_id": session_id,
-                                            "student_name": student_name,
-                                            "roll_no": roll_no or "UNKNOWN",
-                                            "student_id": student_id,
-                                            "subject_code": subject_code,
-                                            "subject_name": subject_name,
-                                        },
-                                        "image_url": image_url,
-                                        "timestamp": datetime.utcnow().isoformat()
-                                    }
-                                    try:
-                                        supabase.table('violations').insert(violation_record).execute()
-                                        logger.info(f"✅ Violation saved: {violation_type} - {v.get('message')}")
-                                        # Only add to saved_violations if successfully saved
-                                        saved_violations.append(v)
-                                    except Exception as db_err:
-                                        logger.error(f"❌ Insert violation failed: {db_err}")
-                            else:
-                                logger.info("✅ No violations detected in this frame")
-                        except Exception as persist_err:
-                            logger.error(f"❌ Persisting violation failed: {persist_err}")
-                        
-                        # Send results back to client - ONLY include violations that were actually saved
-                        # This prevents duplicate counting in the frontend
-                        result_to_send = result.copy()
-                        result_to_send['violations'] = saved_violations
-                        await websocket.send_json({
-                            'type': 'detection_result',
-                            'data': result_to_send
-                        })
-                        logger.info(f"📤 Detection result sent to client")
-                        
-                        # Also send individual violation alerts to frontend (only for saved violations)
-                        if saved_violations:
-                            for v in saved_violations:
-                                await websocket.send_json({
-                                    'type': 'violation',
-                                    'data': {
-                                        'type': v.get('type'),
-                                        'severity': v.get('severity'),
-                                        'message': v.get('message'),
-                                        'confidence': v.get('confidence'),
-                                        'timestamp': datetime.utcnow().isoformat()
-                                    }
-                                })
-                                logger.info(f"🚨 Violation alert sent to frontend: {v.get('type')}")
+                    if result is not None:
+                        await _handle_detection_result(websocket, session_id, message, result)
                     else:
                         logger.error("❌ Frame is None - could not decode image data")
                         await websocket.send_json({
@@ -554,6 +643,36 @@ async def websocket_proctoring(websocket: WebSocket, session_id: str):
                         }
                     })
                     
+            elif message['type'] == 'frame_batch':
+                # Several frames accumulated client-side; YOLO runs once over the whole batch
+                now_ts = asyncio.get_event_loop().time()
+                if (now_ts - last_processed_time) >= FRAME_INTERVAL_SEC:
+                    last_processed_time = now_ts
+                    results = await asyncio.to_thread(_decode_and_process_batch, message, session_id)
+                    
+                    if results is not None:
+                        for result in results:
+                            await _handle_detection_result(websocket, session_id, message, result)
+                    else:
+                        logger.error("❌ Frame batch is empty - could not decode image data")
+                        await websocket.send_json({
+                            'type': 'error',
+                            'data': {'message': 'Failed to decode frame image'}
+                        })
+                else:
+                    await websocket.send_json({
+                        'type': 'detection_skipped',
+                        'data': {
+                            'reason': 'throttled',
+                            'interval_sec': FRAME_INTERVAL_SEC,
+                            'timestamp': datetime.utcnow().isoformat()
+                        }
+                    })
+                    
+            elif message['type'] == 'frame_meta':
+                # Applies to the binary frames that follow on this connection
+                frame_meta = {k: v for k, v in message.items() if k != 'type'}
+                
             elif message['type'] == 'audio':
                 # Process audio level
                 audio_level = float(message.get('audio_level', 0))
@@ -819,7 +938,7 @@ async def upload_violation_snapshot(
     """Upload violation snapshot to Supabase Storage using roll_no for file organization"""
     try:
         # Decode base64 image
-        image_data = base64.b64decode(snapshot_base64.split(',')[1] if ',' in snapshot_base64 else snapshot_base64)
+        image_data = decode_base64(snapshot_base64)
         
         # Generate filename using roll_no instead of student_id
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
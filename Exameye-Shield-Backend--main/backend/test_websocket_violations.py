@@ -1,27 +1,126 @@
 """
 Test WebSocket violation detection end-to-end
 Verifies that violations are properly sent and received via WebSocket
+
+Usage:
+    pytest -n auto test_websocket_violations.py    # in-process; e2e runs too if a server is up on :8001
+    python test_websocket_violations.py            # in-process: call ProctoringService directly
+    python test_websocket_violations.py --e2e      # integration: go through the running server
+    python test_websocket_violations.py --e2e --batch    # ...sending BATCH_SIZE frames as one frame_batch
+    python test_websocket_violations.py --e2e --binary   # ...sending the frame as raw binary pixels
+    python test_websocket_violations.py --e2e --shm      # ...handing the frame over through shared memory
+
+Smoke tests run at 160x120; that is enough to trigger no_person.
+The shared memory mode needs client and server on the same machine, both run with
+EXAMEYE_SHM=1; pytest skips it otherwise.
 """
+import argparse
 import asyncio
-import json
+import orjson
+import os
 import base64
+import socket
+import struct
 import cv2
 import numpy as np
+import pytest
+from multiprocessing.shared_memory import SharedMemory
 from websockets.client import connect
 from datetime import datetime
 
-async def test_websocket_violations():
+from tests_util import buffered_output
+
+def _create_test_frame():
+    """Bright empty frame (should trigger no_person)"""
+    return np.full((120, 160, 3), (200, 200, 200), dtype=np.uint8)  # Bright gray, 160x120
+
+def _encode_test_frame():
+    """Encode the test frame once for the WebSocket path"""
+    test_frame = _create_test_frame()
+    # The server decodes with cv2.imdecode, so PNG works and is far cheaper than JPEG here
+    _, buffer = cv2.imencode('.png', test_frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return base64.b64encode(buffer).decode('utf-8')
+
+CONST_FRAME_B64 = _encode_test_frame()
+
+USE_SHM = bool(os.environ.get('EXAMEYE_SHM'))
+
+# Frame batching: the server runs YOLO once per "frame_batch" message
+BATCH_SIZE = 4
+ACCUMULATE_TIMEOUT_MS = 100
+
+class FrameBatcher:
+    """Accumulate frames and send them as one frame_batch message"""
+
+    def __init__(self, websocket, metadata, batch_size=BATCH_SIZE, accumulate_timeout_ms=ACCUMULATE_TIMEOUT_MS):
+        self.websocket = websocket
+        self.metadata = metadata
+        self.batch_size = batch_size
+        self.accumulate_timeout_ms = accumulate_timeout_ms
+        self.frames = []
+        self._deadline = None
+
+    async def add(self, frame_data_url):
+        """Queue a frame; sends the batch once it is full or the timeout has passed"""
+        if not self.frames:
+            self._deadline = asyncio.get_running_loop().time() + self.accumulate_timeout_ms / 1000
+        self.frames.append(frame_data_url)
+        if len(self.frames) >= self.batch_size or asyncio.get_running_loop().time() >= self._deadline:
+            await self.flush()
+
+    async def flush(self):
+        """Send whatever has accumulated, waiting out the remaining timeout first"""
+        if not self.frames:
+            return
+        remaining = self._deadline - asyncio.get_running_loop().time()
+        if len(self.frames) < self.batch_size and remaining > 0:
+            await asyncio.sleep(remaining)
+        message = {"type": "frame_batch", "frames": self.frames, **self.metadata}
+        self.frames = []
+        # orjson.dumps returns bytes; send text, since the server treats binary messages as raw frames
+        await self.websocket.send(orjson.dumps(message).decode())
+
+@buffered_output
+def test_inprocess_violations(proctoring_service):
+    """Run the frame check against ProctoringService directly, skipping JPEG/base64 and the socket"""
+    print("\n" + "="*60)
+    print("IN-PROCESS VIOLATION DETECTION TEST")
+    print("="*60)
+    
+    result = proctoring_service.process_frame(
+        _create_test_frame(),
+        session_id=f"test_session_{datetime.now().timestamp()}",
+        calibrated_pitch=0.0,
+        calibrated_yaw=0.0
+    )
+    violations_received = [v.get('type') for v in result.get('violations', [])]
+    print(f"📊 Violations received: {violations_received}")
+    
+    # Browser activity violations are handled by the server alone; use --e2e to cover them
+    assert 'no_person' in violations_received, "Missing violations: ['no_person']"
+    print("\n[SUCCESS] PASS: no_person violation detected")
+
+def encode_raw_frame(frame):
+    """Binary frame message: (height, width, channels) little-endian header + raw uint8 pixels"""
+    height, width, channels = frame.shape
+    return struct.pack('<III', height, width, channels) + frame.tobytes()
+
+def _server_running(host='localhost', port=8001):
+    """True if something is listening where the e2e test expects the server"""
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+@buffered_output
+async def run_websocket_violations(mode='frame'):
     """Test WebSocket violation detection"""
     print("\n" + "="*60)
     print("WEBSOCKET VIOLATION DETECTION TEST")
     print("="*60)
     
-    # Create test frame (bright empty frame for no_person detection)
-    test_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-    test_frame[:] = (200, 200, 200)  # Bright gray
-    _, buffer = cv2.imencode('.jpg', test_frame)
-    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-    frame_data_url = f"data:image/jpeg;base64,{frame_base64}"
+    frame_data_url = f"data:image/png;base64,{CONST_FRAME_B64}"
     
     session_id = f"test_session_{datetime.now().timestamp()}"
     ws_url = f"ws://localhost:8001/api/ws/proctoring/{session_id}"
@@ -30,95 +129,114 @@ async def test_websocket_violations():
     print(f"Session ID: {session_id}")
     
     violations_received = []
+    shm_blocks = []
     
     try:
         async with connect(ws_url) as websocket:
             print("[SUCCESS] WebSocket connected")
             
-            # Send a test frame
-            message = {
-                "type": "frame",
-                "frame": frame_data_url,
-                "calibrated_pitch": 0.0,
-                "calibrated_yaw": 0.0,
+            metadata = {
                 "exam_id": "test_exam_id",
                 "student_id": "test_student_id",
                 "student_name": "Test Student",
                 "subject_code": "TEST",
-                "subject_name": "Test Subject"
+                "subject_name": "Test Subject",
+                # Only violations are checked here; ask the server to leave out the
+                # snapshot and debug fields from detection_result
+                "compact": True
             }
             
-            print("\n📤 Sending test frame (should trigger no_person violation)...")
-            await websocket.send(json.dumps(message))
+            # Batch mode queues BATCH_SIZE frames, so the batcher sends as soon as the batch is full
+            batcher = FrameBatcher(websocket, {
+                "calibrated_pitch": 0.0,
+                "calibrated_yaw": 0.0,
+                **metadata
+            })
             
-            # Wait for response
-            print("⏳ Waiting for response...")
-            try:
-                response = await asyncio.wait_for(websocket.recv(), timeout=10.0)
-                data = json.loads(response)
-                print(f"\n📥 Received response: {data.get('type')}")
+            async def send_frame():
+                if mode == 'binary':
+                    # Metadata travels once as JSON; the frame itself as a binary message
+                    await websocket.send(orjson.dumps({
+                        "type": "frame_meta",
+                        "calibrated_pitch": 0.0,
+                        "calibrated_yaw": 0.0,
+                        **metadata
+                    }).decode())
+                    await websocket.send(encode_raw_frame(_create_test_frame()))
+                elif mode == 'shm':
+                    # Zero-codec handoff: the server copies the frame straight out of shared memory
+                    frame = _create_test_frame()
+                    shm = SharedMemory(create=True, size=frame.nbytes)
+                    shm_blocks.append(shm)
+                    np.ndarray(frame.shape, np.uint8, buffer=shm.buf)[:] = frame
+                    await websocket.send(orjson.dumps({
+                        "type": "frame_shm",
+                        "name": shm.name,
+                        "shape": list(frame.shape),
+                        "calibrated_pitch": 0.0,
+                        "calibrated_yaw": 0.0,
+                        **metadata
+                    }).decode())
+                elif mode == 'batch':
+                    for _ in range(BATCH_SIZE):
+                        await batcher.add(frame_data_url)
+                else:
+                    # Plain single-frame message, as the frontend sends it
+                    await websocket.send(orjson.dumps({
+                        "type": "frame",
+                        "frame": frame_data_url,
+                        "calibrated_pitch": 0.0,
+                        "calibrated_yaw": 0.0,
+                        **metadata
+                    }).decode())
+            
+            tab_switch_msg = {
+                "type": "browser_activity",
+                "violation_type": "tab_switch",
+                "message": "Tab switched - student navigated away from exam page",
+                **metadata
+            }
+            copy_paste_msg = {
+                "type": "browser_activity",
+                "violation_type": "copy_paste",
+                "message": "Copy operation attempted",
+                **metadata
+            }
+            
+            expected = ['no_person', 'tab_switch', 'copy_paste']
+            
+            async def send_and_collect():
+                # Fire all three messages at once so the round trips overlap
+                print("\n📤 Sending test frame (should trigger no_person violation)...")
+                print("📤 Sending browser activity violations (tab_switch, copy_paste)...")
+                await asyncio.gather(
+                    send_frame(),
+                    websocket.send(orjson.dumps(tab_switch_msg).decode()),
+                    websocket.send(orjson.dumps(copy_paste_msg).decode())
+                )
                 
-                if data.get('type') == 'detection_result':
-                    result = data.get('data', {})
-                    print(f"   Face count: {result.get('face_count', 0)}")
-                    print(f"   No person: {result.get('no_person', False)}")
-                    print(f"   Violations: {len(result.get('violations', []))}")
+                # Replies can arrive in any order; bucket them by message type
+                print("⏳ Waiting for responses...")
+                while not all(v in violations_received for v in expected):
+                    data = orjson.loads(await websocket.recv())
+                    print(f"\n📥 Received response: {data.get('type')}")
                     
-                    for v in result.get('violations', []):
-                        print(f"   - {v.get('type')}: {v.get('message')}")
-                        violations_received.append(v.get('type'))
-                
-                elif data.get('type') == 'violation':
-                    violation = data.get('data', {})
-                    print(f"   Violation type: {violation.get('type')}")
-                    print(f"   Message: {violation.get('message')}")
-                    violations_received.append(violation.get('type'))
-                
-                # Test browser activity violations
-                print("\n📤 Testing browser activity violations...")
-                
-                # Test tab switch
-                tab_switch_msg = {
-                    "type": "browser_activity",
-                    "violation_type": "tab_switch",
-                    "message": "Tab switched - student navigated away from exam page",
-                    "exam_id": "test_exam_id",
-                    "student_id": "test_student_id",
-                    "student_name": "Test Student",
-                    "subject_code": "TEST",
-                    "subject_name": "Test Subject"
-                }
-                await websocket.send(json.dumps(tab_switch_msg))
-                print("   Sent tab_switch violation")
-                
-                # Wait for response
-                response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                data = json.loads(response)
-                if data.get('type') == 'violation':
-                    violations_received.append(data.get('data', {}).get('type'))
-                    print(f"   [SUCCESS] Received tab_switch violation response")
-                
-                # Test copy/paste
-                copy_paste_msg = {
-                    "type": "browser_activity",
-                    "violation_type": "copy_paste",
-                    "message": "Copy operation attempted",
-                    "exam_id": "test_exam_id",
-                    "student_id": "test_student_id",
-                    "student_name": "Test Student",
-                    "subject_code": "TEST",
-                    "subject_name": "Test Subject"
-                }
-                await websocket.send(json.dumps(copy_paste_msg))
-                print("   Sent copy_paste violation")
-                
-                # Wait for response
-                response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                data = json.loads(response)
-                if data.get('type') == 'violation':
-                    violations_received.append(data.get('data', {}).get('type'))
-                    print(f"   [SUCCESS] Received copy_paste violation response")
-                
+                    if data.get('type') == 'detection_result':
+                        result = data.get('data', {})
+                        print(f"   Violations: {len(result.get('violations', []))}")
+                        
+                        for v in result.get('violations', []):
+                            print(f"   - {v.get('type')}: {v.get('message')}")
+                            violations_received.append(v.get('type'))
+                    
+                    elif data.get('type') == 'violation':
+                        violation = data.get('data', {})
+                        print(f"   Violation type: {violation.get('type')}")
+                        print(f"   Message: {violation.get('message')}")
+                        violations_received.append(violation.get('type'))
+            
+            try:
+                await asyncio.wait_for(send_and_collect(), timeout=10.0)
             except asyncio.TimeoutError:
                 print("❌ Timeout waiting for response")
                 return False
@@ -126,7 +244,6 @@ async def test_websocket_violations():
             print(f"\n📊 Violations received: {violations_received}")
             
             # Verify expected violations
-            expected = ['no_person', 'tab_switch', 'copy_paste']
             missing = [v for v in expected if v not in violations_received]
             
             if not missing:
@@ -141,8 +258,36 @@ async def test_websocket_violations():
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        for shm in shm_blocks:
+            shm.close()
+            shm.unlink()
+
+@pytest.mark.skipif(not _server_running(), reason="no proctoring server on localhost:8001")
+@pytest.mark.parametrize('mode', [
+    'frame', 'batch', 'binary',
+    pytest.param('shm', marks=pytest.mark.skipif(not USE_SHM, reason="EXAMEYE_SHM not set")),
+])
+def test_websocket_violations(mode):
+    """End-to-end check through the running server"""
+    assert asyncio.run(run_websocket_violations(mode=mode))
 
 if __name__ == "__main__":
-    result = asyncio.run(test_websocket_violations())
-    exit(0 if result else 1)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--inprocess', action='store_true', help='call ProctoringService directly (default)')
+    mode.add_argument('--e2e', action='store_true', help='send frames through the WebSocket server on localhost:8001')
+    send = parser.add_mutually_exclusive_group()
+    send.add_argument('--batch', action='store_true', help='with --e2e, send BATCH_SIZE frames as one frame_batch message')
+    send.add_argument('--binary', action='store_true', help='with --e2e, send the frame as a raw binary message')
+    send.add_argument('--shm', action='store_true', help='with --e2e, hand the frame over through shared memory (needs EXAMEYE_SHM=1)')
+    args = parser.parse_args()
+    
+    if args.e2e:
+        send_mode = 'binary' if args.binary else 'batch' if args.batch else 'shm' if args.shm else 'frame'
+        result = asyncio.run(run_websocket_violations(mode=send_mode))
+        exit(0 if result else 1)
+    else:
+        from proctoring_service import get_proctoring_service
+        test_inprocess_violations(get_proctoring_service())
 
@@ -0,0 +1,37 @@
+"""
+Helpers shared by the backend test modules
+Fixtures live in conftest.py; plain functions the tests import go here
+"""
+import contextlib
+import functools
+import inspect
+import io
+import sys
+
+
+def buffered_output(fn):
+    """
+    Collect a test's print() output in a StringIO and write it to stdout once
+    when the test returns (or fails), instead of one write per print
+    """
+    @contextlib.contextmanager
+    def buffered():
+        buf = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buf):
+                yield
+        finally:
+            sys.stdout.write(buf.getvalue())
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with buffered():
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with buffered():
+            return fn(*args, **kwargs)
+    return wrapper